@@ -0,0 +1,144 @@
+""" Benchmark: throughput of the mock API under concurrent clients, with and without DB_ASYNC.
+
+Builds a scaled-up copy of paralympics.db in a temporary directory so that a search runs a slow
+full table scan, then starts the API with uvicorn in a subprocess and sends the same search from
+several concurrent clients.
+
+With ``PARALYMPICS_DB_ASYNC=0`` each query blocks the event loop, so requests are served one at a
+time whatever the number of clients. With it enabled, scan throughput scales with the number of
+clients up to ``PARALYMPICS_DB_MAX_CONCURRENCY`` (and the number of CPU cores, since a scan is CPU
+bound). The benchmark also measures the latency of a cheap primary key lookup while scans are
+running, which shows whether one slow query stalls every other request.
+
+Usage:
+    python benchmarks/bench_api_concurrency.py [--rows 300000] [--requests 48]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.request import urlopen
+
+import requests
+
+ROOT = Path(__file__).parent.parent
+SRC = ROOT.joinpath("src")
+PORT = 8765
+URL = f"http://127.0.0.1:{PORT}/response/search?response_text=no-such-response"
+FAST_URL = f"http://127.0.0.1:{PORT}/question/1"
+
+
+def build_database(directory: Path, rows: int) -> Path:
+    """ Copies paralympics.db and pads the response table with extra rows """
+    db_file = directory.joinpath("paralympics.db")
+    shutil.copy2(SRC.joinpath("data", "paralympics.db"), db_file)
+    with sqlite3.connect(db_file) as conn:
+        conn.executemany(
+            "INSERT INTO response (question_id, response_text, is_correct) VALUES (?, ?, 0)",
+            ((1, f"Padding response {i}") for i in range(rows)),
+        )
+    return db_file
+
+
+def start_server(db_file: Path, use_async: bool, concurrency: int) -> subprocess.Popen:
+    env = os.environ.copy()
+    env.update({
+        "PYTHONPATH": str(SRC),
+        "PARALYMPICS_DATABASE_FILE": str(db_file),
+        "PARALYMPICS_DB_ASYNC": "1" if use_async else "0",
+        "PARALYMPICS_DB_MAX_CONCURRENCY": str(concurrency),
+        "PARALYMPICS_DB_POOL_SIZE": str(concurrency),
+    })
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "data.api:app", "--port", str(PORT), "--log-level",
+         "warning"],
+        env=env,
+    )
+    start = time.time()
+    while True:
+        try:
+            urlopen(f"http://127.0.0.1:{PORT}/openapi.json", timeout=1)
+            return proc
+        except Exception:
+            if time.time() - start > 20:
+                proc.terminate()
+                raise RuntimeError("API server did not start in time")
+            time.sleep(0.1)
+
+
+def run_clients(clients: int, total_requests: int) -> float:
+    """ Sends total_requests searches from the given number of clients; returns requests/second """
+    sessions = [requests.Session() for _ in range(clients)]
+
+    def worker(i):
+        resp = sessions[i % clients].get(URL, timeout=60)
+        resp.raise_for_status()
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(worker, range(clients)))  # warm up connections
+        start = time.perf_counter()
+        list(pool.map(worker, range(total_requests)))
+        elapsed = time.perf_counter() - start
+    return total_requests / elapsed
+
+
+def fast_latency(clients: int, lookups: int = 20) -> float:
+    """ Median latency in ms of a primary key lookup while clients keep running slow scans """
+    stop = False
+
+    def scanner():
+        with requests.Session() as session:
+            while not stop:
+                session.get(URL, timeout=60).raise_for_status()
+
+    timings = []
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        futures = [pool.submit(scanner) for _ in range(clients)]
+        time.sleep(0.2)
+        with requests.Session() as session:
+            for _ in range(lookups):
+                start = time.perf_counter()
+                session.get(FAST_URL, timeout=60).raise_for_status()
+                timings.append((time.perf_counter() - start) * 1000)
+        stop = True
+        for f in futures:
+            f.result()
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--requests", type=int, default=48)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    client_counts = sorted({1, 2, args.concurrency, args.concurrency * 2})
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = build_database(Path(tmp), args.rows)
+        print(f"response table padded with {args.rows} rows; {args.requests} requests per run; "
+              f"{os.cpu_count()} CPU(s)")
+        print(f"{'mode':<8}" + "".join(f"{c:>6} clients" for c in client_counts)
+              + "   lookup p50 during scans")
+        for use_async in (False, True):
+            proc = start_server(db_file, use_async, args.concurrency)
+            try:
+                rates = [run_clients(c, args.requests) for c in client_counts]
+                latency = fast_latency(args.concurrency)
+            finally:
+                proc.terminate()
+                proc.wait()
+            mode = "async" if use_async else "sync"
+            print(f"{mode:<8}" + "".join(f"{r:>8.1f} r/s" for r in rates)
+                  + f"{latency:>16.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
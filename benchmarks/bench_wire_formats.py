@@ -0,0 +1,131 @@
+""" Benchmark: cost of getting the /all data into pandas in each wire format.
+
+Builds a copy of paralympics.db with the games table scaled up to each row count, then for each
+format measures:
+
+- encode: time for the API to produce the response body from the database cursor
+- size: size of the response body
+- decode: time for the Flask app to load the body into a typed DataFrame
+
+"json" is the original path: a list of dicts serialized by the standard library as JSONResponse
+did, then json.loads and pd.DataFrame in the client. "json-fast" is the same list of dicts through
+data.formats.dumps (orjson if installed), as FastJSONResponse does. The other formats, including
+the compact rows-as-arrays JSON, are streamed from cursor batches by data.formats and loaded with
+paralympics.cache.read_frame. No HTTP is involved, so the times show the
+serialization work only.
+
+Usage:
+    python benchmarks/bench_wire_formats.py [--rows 1000 10000 100000]
+"""
+import argparse
+import io
+import json
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT.joinpath("src")))
+
+from data.formats import ENCODERS, MEDIA_TYPES, dumps  # noqa: E402
+from data.paralympics_data import ParalympicsData  # noqa: E402
+from paralympics.cache import loads, read_frame, to_typed_frame  # noqa: E402
+
+
+def build_database(directory: Path, rows: int) -> Path:
+    """ Copies paralympics.db and repeats the games (and their hosts) until /all has ~rows rows """
+    db_file = directory.joinpath(f"paralympics_{rows}.db")
+    shutil.copy2(ROOT.joinpath("src", "data", "paralympics.db"), db_file)
+    with sqlite3.connect(db_file) as conn:
+        games = conn.execute("SELECT * FROM games").fetchall()
+        hosts = dict(conn.execute("SELECT games_id, host_id FROM games_host").fetchall())
+        next_id = conn.execute("SELECT MAX(id) FROM games").fetchone()[0] + 1
+        placeholders = ", ".join("?" for _ in games[0])
+        new_games, new_hosts = [], []
+        total = conn.execute("SELECT COUNT(*) FROM games_host").fetchone()[0]
+        while total < rows:
+            for game in games:
+                new_games.append((next_id, *game[1:]))
+                new_hosts.append((next_id, hosts[game[0]]))
+                next_id += 1
+                total += 1
+                if total >= rows:
+                    break
+        conn.executemany(f"INSERT INTO games VALUES ({placeholders})", new_games)
+        conn.executemany("INSERT INTO games_host (games_id, host_id) VALUES (?, ?)", new_hosts)
+    return db_file
+
+
+def timed(func, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def encode_json(data):
+    # Same settings as starlette's JSONResponse
+    rows = data.get_all_data()
+    return json.dumps(rows, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def decode_json(body):
+    return to_typed_frame(pd.DataFrame(json.loads(body)))
+
+
+def encode_json_fast(data):
+    return dumps(data.get_all_data())
+
+
+def decode_json_fast(body):
+    return to_typed_frame(pd.DataFrame(loads(body)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'format':<9} {'encode ms':>10} {'size KiB':>10} {'decode ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            data = ParalympicsData(build_database(Path(tmp), rows))
+            try:
+                encode_ms, body = timed(lambda: encode_json(data))
+                decode_ms, df = timed(lambda: decode_json(body))
+                print(f"{len(df):>8} {'json':<9} {encode_ms * 1000:>10.1f} {len(body) / 1024:>10.1f}"
+                      f" {decode_ms * 1000:>10.1f}")
+                encode_ms, body = timed(lambda: encode_json_fast(data))
+                decode_ms, df = timed(lambda: decode_json_fast(body))
+                print(f"{len(df):>8} {'json-fast':<9} {encode_ms * 1000:>10.1f} "
+                      f"{len(body) / 1024:>10.1f} {decode_ms * 1000:>10.1f}")
+                for fmt in [f for f in MEDIA_TYPES if f != "json"]:
+                    encode_ms, body = timed(
+                        lambda: b"".join(ENCODERS[fmt](data.stream_all_data())))
+                    if fmt == "parquet":
+                        import pyarrow.parquet as pq
+                        decode = lambda: to_typed_frame(pq.read_table(io.BytesIO(body)).to_pandas())  # noqa: E731
+                    elif fmt == "ndjson":
+                        decode = lambda: to_typed_frame(pd.DataFrame.from_records(  # noqa: E731
+                            [json.loads(line) for line in body.splitlines()]))
+                    else:
+                        decode = lambda: read_frame(body, MEDIA_TYPES[fmt])  # noqa: E731
+                    decode_ms, df = timed(decode)
+                    print(f"{len(df):>8} {fmt:<9} {encode_ms * 1000:>10.1f} "
+                          f"{len(body) / 1024:>10.1f} {decode_ms * 1000:>10.1f}")
+            finally:
+                data.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+""" Group by columns and metric expressions compiled into aggregate SQL.
+
+A metric is a function applied to a column, written as it would be in SQL. Each metric is returned
+in a column named after the function and its arguments.
+
+==================  ===============================================  ========================
+Metric              SQL                                              Column
+==================  ===============================================  ========================
+count(*)            COUNT(*)                                         count
+count(col)          COUNT("col")                                     count_col
+sum(col)            SUM("col")                                       sum_col
+avg(col)            AVG("col")                                       avg_col
+min(col)            MIN("col")                                       min_col
+max(col)            MAX("col")                                       max_col
+ratio(a,b)          SUM("a") * 1.0 / NULLIF(SUM("b"), 0)             ratio_a_b
+==================  ===============================================  ========================
+
+For example ``group_by=event_type,year&metrics=sum(participants),ratio(participants_f,participants)``
+returns event_type, year, sum_participants and ratio_participants_f_participants for each
+event type and year. A ratio is null where the sum of b is 0.
+
+"""
+import re
+from typing import Iterable, List, Tuple
+
+_METRIC = re.compile(r"^\s*(\w+)\s*\(\s*([^)]*?)\s*\)\s*$")
+_METRIC_ITEM = re.compile(r"\w+\s*\([^)]*\)")
+
+# SQL aggregate function for each metric that takes one column
+FUNCTIONS = {"count": "COUNT", "sum": "SUM", "avg": "AVG", "min": "MIN", "max": "MAX"}
+
+
+def split_metrics(metrics: str) -> List[str]:
+    """ Splits a comma separated metrics value, keeping the commas inside parentheses
+
+    Raises:
+        ValueError: if there is text that is not a metric
+    """
+    leftover = _METRIC_ITEM.sub("", metrics).replace(",", "").strip()
+    if leftover:
+        raise ValueError(f"Invalid metrics '{metrics}', expected e.g. sum(participants),count(*)")
+    return [m.strip() for m in _METRIC_ITEM.findall(metrics)]
+
+
+def compile_group_by(group_by: str, columns: Iterable[str]) -> List[str]:
+    """ Validates a comma separated list of group by columns
+
+    Raises:
+        ValueError: if a column is unknown
+    """
+    columns = set(columns)
+    names = [c.strip() for c in (group_by or "").split(",") if c.strip()]
+    unknown = [c for c in names if c not in columns]
+    if unknown:
+        raise ValueError(f"Unknown group_by column(s): {', '.join(unknown)}")
+    return names
+
+
+def compile_metric(metric: str, columns: Iterable[str]) -> Tuple[str, str]:
+    """ Compiles a metric such as 'sum(participants)' into its SQL expression and column name
+
+    Raises:
+        ValueError: for an unknown function or column, or the wrong number of arguments
+    """
+    columns = set(columns)
+    match = _METRIC.match(metric)
+    if match is None:
+        raise ValueError(f"Invalid metric '{metric}', expected e.g. sum(participants)")
+    func = match.group(1).lower()
+    args = [a.strip() for a in match.group(2).split(",")] if match.group(2) else []
+    if func == "count" and args in ([], ["*"]):
+        return "COUNT(*)", "count"
+    unknown = [a for a in args if a not in columns]
+    if unknown:
+        raise ValueError(f"Unknown metric column(s): {', '.join(unknown)}")
+    if func == "ratio":
+        if len(args) != 2:
+            raise ValueError("ratio takes two columns, e.g. ratio(participants_f,participants)")
+        a, b = args
+        return f"SUM(\"{a}\") * 1.0 / NULLIF(SUM(\"{b}\"), 0)", f"ratio_{a}_{b}"
+    if func not in FUNCTIONS:
+        raise ValueError(f"Unknown metric function '{func}', use one of: "
+                         f"{', '.join([*FUNCTIONS, 'ratio'])}")
+    if len(args) != 1:
+        raise ValueError(f"{func} takes one column")
+    return f"{FUNCTIONS[func]}(\"{args[0]}\")", f"{func}_{args[0]}"
+
+
+def compile_metrics(metrics: str, columns: Iterable[str]) -> List[Tuple[str, str]]:
+    """ Compiles a comma separated metrics value into (SQL expression, column name) pairs
+
+    Raises:
+        ValueError: if there are no metrics or a metric is invalid, see compile_metric
+    """
+    columns = list(columns)
+    items = split_metrics(metrics or "")
+    if not items:
+        raise ValueError("metrics needs at least one metric, e.g. metrics=count(*)")
+    compiled = [compile_metric(m, columns) for m in items]
+    return list({name: (sql, name) for sql, name in compiled}.values())
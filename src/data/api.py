@@ -5,16 +5,142 @@
  do not use this as an example for coursework 2!
 
  """
-from typing import Callable
+import asyncio
+import functools
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
 
 import uvicorn
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import RedirectResponse
+from starlette.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
+
+from data.formats import ENCODERS, MEDIA_TYPES, dumps
+from data.index_advisor import IndexAdvisor
+from data.paralympics_data import ALL_DATA, ALL_DATA_TABLES, ParalympicsData
+
+
+class ApiConfig:
+    """Configuration for the mock API.
+
+    Values can be overridden with environment variables of the same name prefixed
+    ``PARALYMPICS_``, e.g. ``PARALYMPICS_DB_POOL_SIZE=10``.
+
+    Attributes:
+        DATABASE_FILE (str): Path to the SQLite database. Defaults to ``None``, the packaged
+            paralympics.db.
+        DB_POOL_SIZE (int): Maximum number of pooled database connections. Defaults to ``5``.
+        DB_POOL_TIMEOUT (float): Seconds to wait for a free pooled connection. Defaults to ``5``.
+        DB_MODE (str): ``disk`` to read the database file, or ``memory`` to copy it into memory
+            when the server starts and serve every read from the copy. The in-memory copy cannot
+            use WAL, so reads and writes wait for each other, and streamed responses are read into
+            memory in full first. Defaults to ``disk``.
+        DB_FLUSH_INTERVAL (float): In ``memory`` mode, seconds between copies of the writes back
+            to the database file; ``0`` copies them before each write returns. Defaults to ``0``.
+        DB_JOURNAL_MODE (str): SQLite journal mode. Defaults to ``wal``, so in ``disk`` mode
+            reads and writes do not block each other. Ignored in ``memory`` mode.
+        DB_SYNCHRONOUS (str): SQLite synchronous setting, ``off``, ``normal``, ``full`` or
+            ``extra``. Defaults to ``normal``.
+        DB_CACHE_SIZE (int): SQLite page cache size per connection, in pages, or in KiB if
+            negative. Defaults to ``-16000`` (16 MB).
+        DB_MMAP_SIZE (int): Bytes of the database file to memory-map, ``0`` turns it off.
+            Defaults to ``0``.
+        DB_BUSY_TIMEOUT (int): Milliseconds a connection waits for a lock held by another
+            connection. Defaults to ``5000``.
+        DB_ASYNC (bool): Run database calls in a thread pool so they do not block the event loop.
+            Defaults to ``True``.
+        DB_MAX_CONCURRENCY (int): Maximum number of database calls running at once when
+            ``DB_ASYNC`` is enabled. Defaults to ``4``.
+        MAX_PAGE_SIZE (int): Largest ``limit`` accepted by the table and search routes; larger
+            values are reduced to this. Defaults to ``1000``.
+        AUTO_INDEX (bool): Create indexes for unindexed foreign key columns when the server
+            starts. Defaults to ``True``.
+        INDEX_MIN_USES (int): Number of searches on a column before the index advisor suggests
+            an index for it. Defaults to ``10``.
+    """
+    DATABASE_FILE = os.environ.get("PARALYMPICS_DATABASE_FILE")
+    DB_POOL_SIZE = int(os.environ.get("PARALYMPICS_DB_POOL_SIZE", 5))
+    DB_POOL_TIMEOUT = float(os.environ.get("PARALYMPICS_DB_POOL_TIMEOUT", 5.0))
+    DB_MODE = os.environ.get("PARALYMPICS_DB_MODE", "disk")
+    DB_FLUSH_INTERVAL = float(os.environ.get("PARALYMPICS_DB_FLUSH_INTERVAL", 0))
+    DB_JOURNAL_MODE = os.environ.get("PARALYMPICS_DB_JOURNAL_MODE", "wal")
+    DB_SYNCHRONOUS = os.environ.get("PARALYMPICS_DB_SYNCHRONOUS", "normal")
+    DB_CACHE_SIZE = int(os.environ.get("PARALYMPICS_DB_CACHE_SIZE", -16000))
+    DB_MMAP_SIZE = int(os.environ.get("PARALYMPICS_DB_MMAP_SIZE", 0))
+    DB_BUSY_TIMEOUT = int(os.environ.get("PARALYMPICS_DB_BUSY_TIMEOUT", 5000))
+    DB_ASYNC = os.environ.get("PARALYMPICS_DB_ASYNC", "1").lower() not in ("0", "false", "no")
+    DB_MAX_CONCURRENCY = int(os.environ.get("PARALYMPICS_DB_MAX_CONCURRENCY", 4))
+    MAX_PAGE_SIZE = int(os.environ.get("PARALYMPICS_MAX_PAGE_SIZE", 1000))
+    AUTO_INDEX = os.environ.get("PARALYMPICS_AUTO_INDEX", "1").lower() not in ("0", "false", "no")
+    INDEX_MIN_USES = int(os.environ.get("PARALYMPICS_INDEX_MIN_USES", 10))
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that serializes with orjson when it is installed (``pip install .[fast]``)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+data = ParalympicsData(
+    ApiConfig.DATABASE_FILE,
+    pool_size=ApiConfig.DB_POOL_SIZE,
+    pool_timeout=ApiConfig.DB_POOL_TIMEOUT,
+    pragmas={
+        "journal_mode": ApiConfig.DB_JOURNAL_MODE,
+        "synchronous": ApiConfig.DB_SYNCHRONOUS,
+        "cache_size": ApiConfig.DB_CACHE_SIZE,
+        "mmap_size": ApiConfig.DB_MMAP_SIZE,
+        "busy_timeout": ApiConfig.DB_BUSY_TIMEOUT,
+    },
+    mode=ApiConfig.DB_MODE,
+    flush_interval=ApiConfig.DB_FLUSH_INTERVAL,
+)
+_tables = data.tables
+index_advisor = IndexAdvisor(data, min_uses=ApiConfig.INDEX_MIN_USES)
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=ApiConfig.DB_MAX_CONCURRENCY,
+                                       thread_name_prefix="paralympics-db")
+    return _executor
+
 
-from data.paralympics_data import ParalympicsData
+async def _run_db(func: Callable, *args, **kwargs):
+    """Run a blocking ParalympicsData call.
 
-app = FastAPI(title="Mock Paralympics API")
+    When ``ApiConfig.DB_ASYNC`` is enabled the call runs in a bounded thread pool so that a slow
+    query does not stall other requests on the event loop.
+    """
+    if not ApiConfig.DB_ASYNC:
+        return func(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create missing foreign key indexes on startup, and close the database thread pool and
+    pooled connections when the server shuts down."""
+    global _executor
+    if ApiConfig.AUTO_INDEX:
+        index_advisor.create_indexes()
+    yield
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    data.close()
+
+
+app = FastAPI(title="Mock Paralympics API", lifespan=lifespan,
+              default_response_class=FastJSONResponse)
 
 origins = [
     "http://localhost",
@@ -30,11 +156,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "Link", "X-Next-Cursor"],
 )
 
-data = ParalympicsData()
-_tables = data.tables
-
 
 @app.get("/", summary="API documentation")
 async def root(request: Request):
@@ -49,12 +173,140 @@ async def root(request: Request):
     raise HTTPException(status_code=404, detail="No API docs configured")
 
 
+def _response_format(request: Request) -> str:
+    """Choose the response format from the ``format`` query parameter, else the Accept header.
+
+    Media types in the Accept header are tried in order of their q values. JSON is used if none
+    of them is offered.
+    """
+    fmt = request.query_params.get("format")
+    if fmt is not None:
+        if fmt not in MEDIA_TYPES:
+            raise HTTPException(status_code=400,
+                                detail=f"format must be one of: {', '.join(MEDIA_TYPES)}")
+        return fmt
+    accepted = []
+    for i, media_range in enumerate(request.headers.get("accept", "").split(",")):
+        media_type, *options = [part.strip() for part in media_range.split(";")]
+        q = 1.0
+        for option in options:
+            if option.startswith("q="):
+                try:
+                    q = float(option[2:])
+                except ValueError:
+                    q = 0.0
+        accepted.append((-q, i, media_type))
+    for _, _, media_type in sorted(accepted):
+        for fmt, offered in MEDIA_TYPES.items():
+            if media_type == offered:
+                return fmt
+    return "json"
+
+
+async def _cache_headers(request: Request, tables: Iterable[str],
+                         fmt: str = "json") -> Dict[str, str]:
+    """Return the ETag and Last-Modified headers for a response built from the given tables.
+
+    The ETag combines the data version of the tables with the request path, query and response
+    format, so it changes whenever a write touches one of the tables. Writes committed by other
+    processes are found first with ParalympicsData.detect_external_writes.
+    """
+    tables = list(tables)
+    await _run_db(data.detect_external_writes, tables)
+    url = f"{request.url.path}?{request.url.query}"
+    variant = hashlib.sha1(f"{url}|{fmt}".encode()).hexdigest()[:12]
+    etag = f'"{data.versions.version(tables)}-{variant}"'
+    last_modified = formatdate(data.versions.last_modified(tables), usegmt=True)
+    return {"ETag": etag, "Last-Modified": last_modified, "Vary": "Accept"}
+
+
+def _stream_response(fmt: str, batches: Iterator, headers: Dict[str, str]) -> StreamingResponse:
+    """Stream row batches to the client, so memory use is bounded by the batch size."""
+    return StreamingResponse(ENCODERS[fmt](batches), media_type=MEDIA_TYPES[fmt],
+                             headers=headers)
+
+
+def _is_not_modified(request: Request, headers: Dict[str, str]) -> bool:
+    """Check the request's If-None-Match, or if absent If-Modified-Since, against the headers."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or headers["ETag"] in tags or f"W/{headers['ETag']}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+            modified = parsedate_to_datetime(headers["Last-Modified"])
+        except (TypeError, ValueError):
+            return False
+        return modified <= since
+    return False
+
+
+def _page_args(params: Dict[str, str]) -> Dict[str, Any]:
+    """Remove the paging, sorting and projection query parameters from params and parse them.
+
+    Raises:
+        ValueError: if limit is not a positive integer
+    """
+    limit = params.pop("limit", None)
+    after = params.pop("after", None)
+    fields = params.pop("fields", None)
+    order_by = params.pop("order_by", None)
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("limit must be an integer") from None
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        limit = min(limit, ApiConfig.MAX_PAGE_SIZE)
+    if fields is not None:
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    return {"limit": limit, "after": after, "fields": fields, "order_by": order_by}
+
+
+def _page_headers(request: Request, next_cursor) -> Dict[str, str]:
+    """Return a Link header for the next page, if there is one."""
+    if next_cursor is None:
+        return {}
+    next_url = request.url.include_query_params(after=next_cursor)
+    return {"Link": f'<{next_url}>; rel="next"', "X-Next-Cursor": str(next_cursor)}
+
+
 def _make_get_all_route(table_name: str) -> Callable:
-    """ Create a GET /<table> route to get all data from a table """
+    """ Create a GET /<table> route to get all data from a table
+
+    Optional query parameters:
+    - limit: maximum number of rows to return. Rows are then returned in primary key order and
+      if there are more rows the response has a Link header with rel="next" (and X-Next-Cursor).
+    - after: cursor from the previous page, i.e. return rows after this primary key value.
+    - fields: comma separated list of the columns to return, e.g. fields=id,question_text
+    - order_by: comma separated columns to sort by, prefixed with - for descending, e.g.
+      order_by=-year. With order_by, limit returns the first rows and there is no next page.
+    - format: json (default); compact for {"columns": [...], "rows": [[...], ...]}, which does
+      not repeat the column names in every row; ndjson to stream one JSON object per line; csv;
+      or, if pyarrow is installed, arrow (Arrow IPC stream) or parquet. The format can also be chosen with the
+      Accept header, e.g. Accept: application/vnd.apache.arrow.stream.
+    """
 
-    async def _route():
+    async def _route(request: Request):
+        fmt = _response_format(request)
+        headers = await _cache_headers(request, [table_name], fmt)
+        if _is_not_modified(request, headers):
+            return Response(status_code=304, headers=headers)
         try:
-            return data.get_table_as_json(table_name)
+            params = dict(request.query_params)
+            params.pop("format", None)
+            page = _page_args(params)
+            if fmt != "json":
+                batches = await _run_db(data.stream_table, table_name, **page)
+                return _stream_response(fmt, batches, headers)
+            rows, next_cursor = await _run_db(data.query_table, table_name, **page)
+            headers.update(_page_headers(request, next_cursor))
+            return FastJSONResponse(rows, headers=headers)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
         except AttributeError:
             raise HTTPException(status_code=500, detail="ParalympicsData.get_json not implemented")
         except Exception as exc:
@@ -66,12 +318,15 @@ def _make_get_all_route(table_name: str) -> Callable:
 def _make_get_by_id_route(table_name: str) -> Callable:
     """ Create a GET /<table>/{item_id} route to get a row by its primary key """
 
-    async def _route(item_id: int):
+    async def _route(request: Request, item_id: int):
+        headers = await _cache_headers(request, [table_name])
+        if _is_not_modified(request, headers):
+            return Response(status_code=304, headers=headers)
         try:
-            row = data.get_row_by_id(table_name, item_id)
+            row = await _run_db(data.get_row_by_id, table_name, item_id)
             if row is None:
                 raise HTTPException(status_code=404, detail="Item not found")
-            return row
+            return FastJSONResponse(row, headers=headers)
         except HTTPException:
             raise
         except Exception as exc:
@@ -87,22 +342,96 @@ def _make_search_route(table_name: str) -> Callable:
     Usage:
     - Provide one or more query parameters where each key is a column name and the
       value is the exact value to match.
+    - Add an operator to the column name for other comparisons: __ne, __gt, __gte, __lt, __lte,
+      __in (comma separated values), __startswith (prefix, ignoring case) and __isnull (true or
+      false). See data.filters.
     - Multiple parameters are combined with logical AND.
 
     Examples:
     - /games/search?event_type=summer
     - /games/search?event_type=summer&year=2020
+    - /games/search?year__gte=2000&year__lt=2010&order_by=-year
+    - /host/search?place_name__startswith=Lon&latitude__isnull=false
 
     Notes:
-    - Only columns that exist in the table are considered; unknown query keys are ignored.
-    - Matching is exact equality (\"column\" = ?). Wildcards/partial matches are not supported.
+    - Only columns that exist in the table are considered; unknown plain query keys are ignored,
+      but an unknown column or operator with __ returns 400.
+    - Filters are compiled into parameterized SQL, so only the matching rows are read.
     - If no valid query parameters are supplied, the endpoint returns all rows for the table.
+    - Responses include an ETag and Last-Modified; send If-None-Match to get 304 Not Modified
+      when the table has not changed.
+    - limit, after, fields, order_by and format are not filters; they page, sort, project and
+      format the results in the same way as GET /<table>.
     """
 
     async def _route(request: Request):
+        fmt = _response_format(request)
+        headers = await _cache_headers(request, [table_name], fmt)
+        if _is_not_modified(request, headers):
+            return Response(status_code=304, headers=headers)
         try:
             params = dict(request.query_params)
-            return data.search_table(table_name, params)
+            params.pop("format", None)
+            page = _page_args(params)
+            if fmt != "json":
+                batches = await _run_db(data.stream_table, table_name, params, **page)
+                return _stream_response(fmt, batches, headers)
+            rows, next_cursor = await _run_db(data.query_table, table_name, params, **page)
+            headers.update(_page_headers(request, next_cursor))
+            return FastJSONResponse(rows, headers=headers)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=str(exc))
+
+    return _route
+
+
+async def _aggregate_response(request: Request, table_name: str, tables: Iterable[str]):
+    """Run an aggregate query from the request's query parameters; see _make_aggregate_route."""
+    fmt = _response_format(request)
+    headers = await _cache_headers(request, tables, fmt)
+    if _is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    params = dict(request.query_params)
+    params.pop("format", None)
+    group_by = params.pop("group_by", None)
+    metrics = params.pop("metrics", None)
+    page = _page_args(params)
+    if page["after"] is not None or page["fields"] is not None:
+        raise ValueError("after and fields are not supported for aggregates")
+    args = (table_name, group_by, metrics, params, page["order_by"], page["limit"])
+    if fmt != "json":
+        batches = await _run_db(data.stream_aggregate, *args)
+        return _stream_response(fmt, batches, headers)
+    rows = await _run_db(data.aggregate_table, *args)
+    return FastJSONResponse(rows, headers=headers)
+
+
+def _make_aggregate_route(table_name: str) -> Callable:
+    """
+    Create a GET '/<table>/aggregate' route that returns metrics for groups of rows.
+
+    Query parameters:
+    - group_by: comma separated columns to group by. Omit it for one row of totals.
+    - metrics: comma separated metrics: count(*), count(col), sum(col), avg(col), min(col),
+      max(col) and ratio(a,b), which is SUM(a) / SUM(b). Each metric is returned in a column
+      named after it, e.g. sum_participants or ratio_participants_f_participants.
+    - any filters accepted by GET /<table>/search, applied before grouping.
+    - order_by: group by or metric columns to sort by; defaults to the group by columns.
+    - limit and format: as for GET /<table>.
+
+    Example:
+    - /games/aggregate?group_by=event_type,year&metrics=sum(participants),avg(events)
+    """
+
+    async def _route(request: Request):
+        try:
+            return await _aggregate_response(request, table_name, [table_name])
+        except HTTPException:
+            raise
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
         except Exception as exc:
             raise HTTPException(status_code=500, detail=str(exc))
 
@@ -135,7 +464,7 @@ def _make_post_route(table_name: str) -> Callable:
             payload = await request.json()
             if not isinstance(payload, dict):
                 raise HTTPException(status_code=400, detail="Request body must be a JSON object")
-            new_row = data.add_row(table_name, payload)
+            new_row = await _run_db(data.add_row, table_name, payload)
             return new_row
         except HTTPException:
             raise
@@ -149,20 +478,156 @@ def _make_post_route(table_name: str) -> Callable:
 for _t in _tables:
     app.get(f"/{_t}", name=f"{_t}_all")(_make_get_all_route(_t))
     app.get(f"/{_t}/search", name=f"{_t}_search")(_make_search_route(_t))
+    app.get(f"/{_t}/aggregate", name=f"{_t}_aggregate")(_make_aggregate_route(_t))
     app.get(f"/{_t}/{{item_id}}", name=f"{_t}_get")(_make_get_by_id_route(_t))
     app.post(f"/{_t}", name=f"{_t}_post")(_make_post_route(_t))
 
 
 # Create a route to get data for the charts
 @app.get("/all")
-async def get_all():
+async def get_all(request: Request):
+    """Return the joined games, host and country data used by the charts.
+
+    Use ?format= or the Accept header to get the rows as ndjson, csv, arrow or parquet; see
+    GET /<table>. The response body for each format is built once and served from memory until
+    one of the joined tables changes.
+    """
+    fmt = _response_format(request)
     try:
-        return data.get_all_data()
+        headers = await _cache_headers(request, ALL_DATA_TABLES, fmt)
+        if _is_not_modified(request, headers):
+            return Response(status_code=304, headers=headers)
+        body = await _run_db(data.get_all_data_bytes, fmt)
+        return Response(body, media_type=MEDIA_TYPES[fmt], headers=headers)
     except AttributeError:
         raise HTTPException(status_code=500, detail="ParalympicsData.get_json not implemented")
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
 
+@app.get("/all/search")
+async def search_all(request: Request):
+    """Return the rows of the /all data that match the query parameters.
+
+    Takes the same filters, order_by, limit, fields and format parameters as GET /<table>/search,
+    applied to the columns of /all, e.g. /all/search?event_type=winter&year__gte=2000. The
+    filters run in SQL so only the matching rows are sent. after is not supported.
+    """
+    fmt = _response_format(request)
+    try:
+        headers = await _cache_headers(request, ALL_DATA_TABLES, fmt)
+        if _is_not_modified(request, headers):
+            return Response(status_code=304, headers=headers)
+        params = dict(request.query_params)
+        params.pop("format", None)
+        page = _page_args(params)
+        if fmt != "json":
+            batches = await _run_db(data.stream_table, ALL_DATA, params, **page)
+            return _stream_response(fmt, batches, headers)
+        rows, _ = await _run_db(data.query_table, ALL_DATA, params, **page)
+        return FastJSONResponse(rows, headers=headers)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
+@app.get("/all/aggregate")
+async def aggregate_all(request: Request):
+    """Return metrics for groups of the /all rows.
+
+    Takes the same parameters as GET /<table>/aggregate, applied to the columns of /all, e.g.
+    /all/aggregate?group_by=year,place_name&metrics=ratio(participants_f,participants)
+    """
+    try:
+        return await _aggregate_response(request, ALL_DATA, ALL_DATA_TABLES)
+    except HTTPException:
+        raise
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
+@app.get("/quiz", summary="All quiz questions with their responses")
+async def get_quiz(request: Request):
+    """Return every question with its responses, and the number of questions, in one response.
+
+    The ETag changes whenever a question or response is added, so clients can keep the whole quiz
+    and revalidate it with If-None-Match.
+    """
+    headers = await _cache_headers(request, ("question", "response"))
+    if _is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    try:
+        quiz = await _run_db(data.get_quiz)
+        return FastJSONResponse(quiz, headers=headers)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
+@app.get("/quiz/{question_id}", summary="Quiz question with its responses")
+async def get_quiz_question(request: Request, question_id: int):
+    """Return a question, its responses and the total number of questions in one response.
+
+    If there is no question with the id, ``question`` is null and ``responses`` is empty, but
+    ``question_count`` is still returned.
+    """
+    headers = await _cache_headers(request, ("question", "response"))
+    if _is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    try:
+        quiz = await _run_db(data.get_quiz_question, question_id)
+        return FastJSONResponse(quiz, headers=headers)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
+@app.post("/quiz", summary="Add a quiz question with its responses")
+async def add_quiz_question(request: Request):
+    """Insert a question and its responses in one transaction.
+
+    The body is a question object with a ``responses`` list, for example::
+
+        {"question_text": "...", "responses": [{"response_text": "...", "is_correct": true}]}
+
+    Returns the inserted question and responses, including their new ids.
+    """
+    try:
+        payload = await request.json()
+        if not isinstance(payload, dict):
+            raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+        responses = payload.pop("responses", [])
+        if not isinstance(responses, list) or not all(isinstance(r, dict) for r in responses):
+            raise HTTPException(status_code=400, detail="responses must be a list of JSON objects")
+        return await _run_db(data.add_quiz_question, payload, responses)
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
+@app.get("/admin/indexes", summary="Index advisor report")
+async def get_index_report():
+    """Return the query plan for each foreign key lookup and each search shape seen so far.
+
+    ``scan`` is true where the query reads the whole table, and ``suggestions`` lists the
+    (table, column) pairs the advisor would index.
+    """
+    report = await _run_db(index_advisor.report)
+    suggestions = await _run_db(index_advisor.suggestions)
+    return {"queries": report, "suggestions": [list(s) for s in suggestions]}
+
+
+@app.post("/admin/indexes", summary="Create the suggested indexes")
+async def create_indexes():
+    """Create an index for each column suggested by the index advisor."""
+    try:
+        created = await _run_db(index_advisor.create_indexes)
+        return {"created": created}
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
 if __name__ == "__main__":
     uvicorn.run("src.data.api:app", host="127.0.0.1", port=8000, reload=True)
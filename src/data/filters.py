@@ -0,0 +1,121 @@
+""" Search filters and sort orders compiled into parameterized SQL.
+
+A filter key is a column name, optionally followed by ``__`` and an operator, e.g. ``year__gte``.
+Filter values are passed as SQL parameters and never formatted into the statement.
+
+==============  ===============================  ===================================
+Key             SQL                              Example
+==============  ===============================  ===================================
+col             "col" = ?                        event_type=summer
+col__ne         "col" != ?                       event_type__ne=winter
+col__gt         "col" > ?                        year__gt=2000
+col__gte        "col" >= ?                       year__gte=2000
+col__lt         "col" < ?                        year__lt=2000
+col__lte        "col" <= ?                       year__lte=2000
+col__in         "col" IN (?, ?, ...)             year__in=2012,2016,2020
+col__startswith "col" LIKE ? ESCAPE '\\'         place_name__startswith=Lon
+col__isnull     "col" IS NULL / IS NOT NULL      participants_f__isnull=false
+==============  ===============================  ===================================
+
+``startswith`` uses LIKE, so it ignores case for ASCII letters.
+
+An order_by value is a comma separated list of columns, each optionally prefixed with ``-`` for
+descending order, e.g. ``order_by=event_type,-year``.
+
+"""
+from typing import Dict, Iterable, List, Tuple
+
+# SQL comparison for each operator that takes a single value
+COMPARISONS = {"eq": "=", "ne": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+OPERATORS = (*COMPARISONS, "in", "startswith", "isnull")
+
+# Largest number of values accepted by an __in filter
+MAX_IN_VALUES = 500
+
+_TRUE = ("1", "true", "yes")
+_FALSE = ("0", "false", "no")
+
+
+def split_key(key: str) -> Tuple[str, str]:
+    """ Splits a filter key into its column and operator, e.g. 'year__gte' -> ('year', 'gte') """
+    column, sep, op = key.rpartition("__")
+    if not sep or not column:
+        return key, "eq"
+    return column, op
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def compile_filters(filters: Dict[str, str], columns: Iterable[str]):
+    """ Compiles search filters into SQL conditions.
+
+    Plain keys that are not columns are ignored, as they always have been by the search routes.
+    A key with an operator must name a known column and operator.
+
+    Args:
+        filters: dict of filter key to value
+        columns: names of the columns that can be filtered
+
+    Returns:
+        (clauses, values, filtered): the SQL conditions to AND together, their parameter values, and
+        the columns that were filtered
+
+    Raises:
+        ValueError: for an unknown column or operator, or a value the operator cannot use
+    """
+    columns = set(columns)
+    clauses: List[str] = []
+    values: List = []
+    filtered: List[str] = []
+    for key, value in filters.items():
+        column, op = split_key(key)
+        if column not in columns:
+            if op == "eq" and "__" not in key:
+                continue
+            raise ValueError(f"Unknown filter column: {column}")
+        if op in COMPARISONS:
+            clauses.append(f"\"{column}\" {COMPARISONS[op]} ?")
+            values.append(value)
+        elif op == "in":
+            items = [v.strip() for v in str(value).split(",") if v.strip()]
+            if not items:
+                raise ValueError(f"{key} needs at least one value")
+            if len(items) > MAX_IN_VALUES:
+                raise ValueError(f"{key} accepts at most {MAX_IN_VALUES} values")
+            clauses.append(f"\"{column}\" IN ({', '.join('?' for _ in items)})")
+            values.extend(items)
+        elif op == "startswith":
+            clauses.append(f"\"{column}\" LIKE ? ESCAPE '\\'")
+            values.append(_escape_like(str(value)) + "%")
+        elif op == "isnull":
+            flag = str(value).lower()
+            if flag not in _TRUE + _FALSE:
+                raise ValueError(f"{key} must be true or false")
+            clauses.append(f"\"{column}\" IS {'' if flag in _TRUE else 'NOT '}NULL")
+        else:
+            raise ValueError(f"Unknown filter operator '{op}', use one of: {', '.join(OPERATORS)}")
+        filtered.append(column)
+    return clauses, values, filtered
+
+
+def compile_order_by(order_by: str, columns: Iterable[str]) -> str:
+    """ Compiles an order_by value such as 'event_type,-year' into an ORDER BY expression
+
+    Raises:
+        ValueError: if a column is unknown
+    """
+    columns = set(columns)
+    terms = []
+    for item in order_by.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        column = item.lstrip("-")
+        if column not in columns:
+            raise ValueError(f"Unknown order_by column: {column}")
+        terms.append(f"\"{column}\" {'DESC' if item.startswith('-') else 'ASC'}")
+    if not terms:
+        raise ValueError("order_by needs at least one column")
+    return ", ".join(terms)
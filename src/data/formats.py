@@ -0,0 +1,206 @@
+""" Encoders that stream row batches from ParalympicsData in each response format.
+
+Each encoder takes the iterator returned by ``ParalympicsData.stream_table`` (the column names,
+then lists of row tuples) and yields bytes, so a response is built one batch at a time.
+
+The Arrow IPC and Parquet encoders read every batch before writing the first, because the column
+types in their schema must hold all of the values. They need the optional pyarrow package
+(``pip install .[arrow]``); if it is not installed those formats are not offered.
+
+JSON is serialized with orjson if it is installed (``pip install .[fast]``), otherwise with the
+standard library.
+
+The compact format is JSON with the column names once, then each row as an array::
+
+    {"columns": ["id", "year"], "rows": [[1, 1960], [2, 1964]]}
+
+"""
+import csv
+import io
+import json
+from typing import Iterator, List
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+    pq = None
+
+
+def dumps(value) -> bytes:
+    """ Serializes a value as compact UTF-8 JSON, with orjson if it is installed """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def encode_json(batches: Iterator) -> Iterator[bytes]:
+    """ Encodes rows as a JSON array of objects """
+    columns = next(batches)
+    separator = b"["
+    for batch in batches:
+        if batch:
+            # Serialize the batch as an array, then drop its brackets to join it to the others
+            yield separator + dumps([dict(zip(columns, row)) for row in batch])[1:-1]
+            separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
+
+def encode_compact(batches: Iterator) -> Iterator[bytes]:
+    """ Encodes rows in the compact format: the column names, then each row as an array.
+
+    The cursor row tuples are serialized directly, without building a dict per row.
+    """
+    yield b'{"columns":' + dumps(next(batches)) + b',"rows":'
+    separator = b"["
+    for batch in batches:
+        if batch:
+            yield separator + dumps(batch)[1:-1]
+            separator = b","
+    yield b"[]}" if separator == b"[" else b"]}"
+
+
+def encode_ndjson(batches: Iterator) -> Iterator[bytes]:
+    """ Encodes rows as newline delimited JSON, one object per row """
+    columns = next(batches)
+    for batch in batches:
+        yield b"".join(dumps(dict(zip(columns, row))) + b"\n" for row in batch)
+
+
+def encode_csv(batches: Iterator) -> Iterator[bytes]:
+    """ Encodes rows as CSV with a header row. NULL values are written as empty fields. """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(next(batches))
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ByteSink:
+    """ Write-only file object that collects the bytes written by a pyarrow writer.
+
+    The position is tracked separately from the collected bytes, so the bytes can be handed out
+    after each batch while writers that record offsets, such as Parquet, still see the true
+    position in the stream.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_type(kinds: set):
+    """ Chooses an Arrow type that holds every value of a column, given the types of its values
+
+    SQLite columns can hold values of different types, so integers mixed with floats become
+    float64, and any other mix becomes strings. A column with only nulls has the null type.
+    """
+    kinds = kinds - {type(None)}
+    if not kinds:
+        return pa.null()
+    if kinds <= {int, bool}:
+        return pa.int64()
+    if kinds <= {int, bool, float}:
+        return pa.float64()
+    if kinds == {bytes}:
+        return pa.binary()
+    return pa.string()
+
+
+def _arrow_schema(columns: List[str], batches: List[list]):
+    kinds = [set() for _ in columns]
+    for batch in batches:
+        for column_kinds, values in zip(kinds, zip(*batch)):
+            column_kinds.update(map(type, values))
+    return pa.schema([(name, _arrow_type(k)) for name, k in zip(columns, kinds)])
+
+
+def _record_batch(schema, batch: list):
+    arrays = []
+    for field, values in zip(schema, zip(*batch)):
+        if field.type == pa.string():
+            values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _encode_arrow_file(batches: Iterator, new_writer) -> Iterator[bytes]:
+    """ Writes each batch as an Arrow record batch using the given pyarrow writer
+
+    Arrow needs the schema before the first batch is written, and the type of a column can only
+    be known from all of its values, so the row batches are all read before the first is written.
+    """
+    columns = next(batches)
+    row_batches = [batch for batch in batches if batch]
+    schema = _arrow_schema(columns, row_batches)
+    sink = _ByteSink()
+    writer = new_writer(pa.PythonFile(sink, mode="w"), schema)
+    for batch in row_batches:
+        writer.write_batch(_record_batch(schema, batch))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def encode_arrow(batches: Iterator) -> Iterator[bytes]:
+    """ Encodes rows in the Arrow IPC streaming format, one record batch per row batch """
+    return _encode_arrow_file(batches, pa.ipc.new_stream)
+
+
+def encode_parquet(batches: Iterator) -> Iterator[bytes]:
+    """ Encodes rows as a Parquet file, one row group per row batch """
+    return _encode_arrow_file(batches, pq.ParquetWriter)
+
+
+# Media type of each response format offered by the table and /all routes
+MEDIA_TYPES = {
+    "json": "application/json",
+    "compact": "application/vnd.paralympics.compact+json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Encoders for each response format. JSON pages are normally returned whole, not streamed.
+ENCODERS = {
+    "json": encode_json,
+    "compact": encode_compact,
+    "ndjson": encode_ndjson,
+    "csv": encode_csv,
+}
+
+if pa is not None:
+    MEDIA_TYPES["arrow"] = "application/vnd.apache.arrow.stream"
+    MEDIA_TYPES["parquet"] = "application/vnd.apache.parquet"
+    ENCODERS["arrow"] = encode_arrow
+    ENCODERS["parquet"] = encode_parquet
@@ -0,0 +1,144 @@
+""" Index advisor for the paralympics database.
+
+The schema has no secondary indexes, so searches filter with a full table scan. The advisor uses the
+schema catalog and the searches recorded by ParalympicsData to suggest indexes for foreign key
+columns and frequently filtered columns, creates them, and uses EXPLAIN QUERY PLAN to report which
+searches still scan a whole table.
+
+Run as a management command to create the foreign key indexes and print the report::
+
+    python -m data.index_advisor [--database paralympics.db] [--report-only]
+
+"""
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+from data.paralympics_data import ParalympicsData
+
+
+def index_name(table_name: str, column: str) -> str:
+    return f"ix_{table_name}_{column}"
+
+
+class IndexAdvisor:
+    """ Suggests, creates and checks secondary indexes for a ParalympicsData database.
+
+    Attributes:
+        data: ParalympicsData instance whose schema and search statistics are used
+        min_uses: number of searches on a column before it counts as a hot filter column
+
+    Methods:
+        suggestions(self): Returns the (table, column) pairs that should be indexed
+        create_indexes(self): Creates the suggested indexes
+        explain(self, table_name, columns): Returns the query plan for a search on the columns
+        report(self): Returns the query plan for each foreign key and recorded search
+    """
+
+    def __init__(self, data: ParalympicsData, min_uses: int = 10):
+        self.data = data
+        self.min_uses = min_uses
+
+    def _schema(self, table_name: str):
+        with self.data.pool.connection() as conn:
+            self.data.catalog.refresh(conn)
+        return self.data.catalog.table(table_name)
+
+    def _is_indexed(self, table_name: str, column: str) -> bool:
+        """ True if the column is the primary key or the leading column of an index """
+        schema = self._schema(table_name)
+        if column == schema.primary_key and schema.column(column).type == "INTEGER":
+            return True  # INTEGER PRIMARY KEY is the rowid
+        return any(index.columns[:1] == (column,) for index in schema.indexes)
+
+    def foreign_key_columns(self) -> List[Tuple[str, str]]:
+        return [(table_name, fk.column)
+                for table_name in self.data.tables
+                for fk in self._schema(table_name).foreign_keys]
+
+    def hot_filter_columns(self) -> List[Tuple[str, str]]:
+        uses: Dict[Tuple[str, str], int] = {}
+        for (table_name, columns), count in list(self.data.filter_usage.items()):
+            for column in columns:
+                uses[(table_name, column)] = uses.get((table_name, column), 0) + count
+        return [key for key, count in sorted(uses.items()) if count >= self.min_uses]
+
+    def suggestions(self) -> List[Tuple[str, str]]:
+        """ Returns the foreign key and hot filter columns that do not have an index """
+        wanted = dict.fromkeys(self.foreign_key_columns() + self.hot_filter_columns())
+        return [(t, c) for t, c in wanted if not self._is_indexed(t, c)]
+
+    def create_indexes(self) -> List[str]:
+        """ Creates an index for each suggested column
+
+        Returns:
+            names: names of the indexes created
+        """
+        created = []
+        with self.data.pool.connection() as conn:
+            with conn:
+                for table_name, column in self.suggestions():
+                    name = index_name(table_name, column)
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS \"{name}\" ON \"{table_name}\" (\"{column}\")"
+                    )
+                    created.append(name)
+            # The schema version has changed so the catalog reloads on its next use
+            self.data.catalog.refresh(conn)
+        return created
+
+    def explain(self, table_name: str, columns) -> List[str]:
+        """ Returns the EXPLAIN QUERY PLAN details for a search on the columns of a table """
+        where = " AND ".join(f"\"{c}\" = ?" for c in columns)
+        sql = f"EXPLAIN QUERY PLAN SELECT * FROM \"{table_name}\" WHERE {where}"
+        with self.data.pool.connection() as conn:
+            # row format: (id, parent, notused, detail)
+            return [row[3] for row in conn.execute(sql, [None] * len(columns))]
+
+    def report(self) -> List[Dict]:
+        """ Returns the query plan for a lookup on each foreign key and each recorded search
+
+        Returns:
+            report: list of dicts with table, columns, uses (searches recorded), plan and scan (True
+            if the query still reads the whole table)
+        """
+        shapes: Dict[Tuple[str, Tuple[str, ...]], int] = {
+            (table_name, (column,)): 0 for table_name, column in self.foreign_key_columns()
+        }
+        for key, count in list(self.data.filter_usage.items()):
+            shapes[key] = count
+        report = []
+        for (table_name, columns), uses in sorted(shapes.items()):
+            plan = self.explain(table_name, columns)
+            report.append({
+                "table": table_name,
+                "columns": list(columns),
+                "uses": uses,
+                "plan": plan,
+                "scan": any(detail.startswith("SCAN") for detail in plan),
+            })
+        return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Create indexes for foreign key columns and "
+                                                 "report which searches scan a whole table.")
+    parser.add_argument("--database", help="path to the database, defaults to paralympics.db")
+    parser.add_argument("--report-only", action="store_true", help="do not create indexes")
+    args = parser.parse_args(argv)
+
+    data = ParalympicsData(args.database)
+    try:
+        advisor = IndexAdvisor(data)
+        if not args.report_only:
+            for name in advisor.create_indexes():
+                print(f"Created index {name}")
+        for item in advisor.report():
+            status = "SCAN" if item["scan"] else "ok"
+            print(f"{status:<5} {item['table']}({', '.join(item['columns'])}): "
+                  f"{'; '.join(item['plan'])}")
+    finally:
+        data.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,64 @@
+import itertools
 import json
 import sqlite3
+import threading
+from collections import Counter
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import pandas as pd
 
+from data.aggregates import compile_group_by, compile_metrics
+from data.filters import compile_filters, compile_order_by
+from data.formats import ENCODERS
+from data.pool import ConnectionPool, connect
+from data.schema import SchemaCatalog, TableSchema
+from data.snapshot import MemorySnapshot
+from data.versions import DataVersions
+from data.writer import WriteQueue
+
+# Name used in place of a table name to query the get_all_data rows, e.g. query_table(ALL_DATA)
+ALL_DATA = "all"
+# Table of the number of rows changed in each table, kept up to date by triggers
+CHANGES_TABLE = "table_changes"
+# Tables joined by get_all_data
+ALL_DATA_TABLES = ("games", "games_host", "host", "country")
+ALL_DATA_SQL = (
+    "SELECT country.country_name, games.event_type, games.year, games.start_date, "
+    "games.end_date, host.place_name, games.events, games.sports, games.countries, "
+    "games.participants_m, games.participants_f, games.participants, host.latitude, "
+    "host.longitude "
+    "FROM games "
+    "JOIN games_host ON games.id = games_host.games_id "
+    "JOIN host ON games_host.host_id = host.id "
+    "JOIN country ON host.country_id = country.id"
+)
+
 
 class ParalympicsData:
     """ Class representing the paralympics data in JSON format.
 
     Each method returns all rows from a table as JSON.
 
+    Queries run on connections borrowed from a :class:`ConnectionPool`, so connections are opened
+    once and reused rather than opened and closed for every call. Call :meth:`close` when the
+    data is no longer needed.
+
+    In ``memory`` mode the database is copied into memory when the instance is created and every
+    query reads the copy; writes are copied back to the file, see data.snapshot. The in-memory
+    database cannot use WAL, so a read and a write cannot run at the same time: streamed results
+    are read in full before they are returned, so a slow client does not hold up writes.
+
     Attributes:
         database_file: path to the database file
         tables: list of table names from the database
+        pool: pool of persistent connections to the database
+        writer: queue that runs every write on one connection, committing them in batches
+        mode: disk to read the database file, or memory to read an in-memory copy of it
+        snapshot: the in-memory copy in memory mode, otherwise None
+        catalog: cached schema of the database tables
+        versions: data version of each table, bumped by every write
+        filter_usage: count of searches for each (table, filtered columns) combination
 
     Methods:
         get_table_as_json(self, table_name): Gets the data from the specified table and returns it as JSON
@@ -21,47 +66,104 @@ class ParalympicsData:
         get_row_by_id(self, row_id): Gets the data from the specified row and returns it as JSON
         add_row(self, row_id): Adds a new row to the table
         search_table(self, table_name, filters): Gets rows based on search criteria in any column
+        query_table(self, table_name, ...): Gets a filtered, projected page of rows from a table
+        stream_table(self, table_name, ...): Streams rows from a table in batches
+        aggregate_table(self, table_name, group_by, metrics, ...): Gets metrics for groups of rows
+        stream_aggregate(self, table_name, group_by, metrics, ...): Streams aggregate_table rows
+        stream_all_data(self): Streams the get_all_data rows in batches
+        get_all_data_bytes(self, fmt): Gets the get_all_data rows serialized, from a cache
+        detect_external_writes(self, tables): Checks for changes committed by other connections
+        get_quiz_question(self, question_id): Gets a question, its responses and the question count
+        get_quiz(self): Gets every question with its responses, and the question count
+        add_quiz_question(self, question, responses): Adds a question and its responses together
+        close(self): Closes the pooled database connections
 
     """
 
-    def __init__(self):
-        self.database_file = Path(__file__).parent.joinpath("paralympics.db")
+    def __init__(self, database_file=None, pool_size: int = 5, pool_timeout: float = 5.0,
+                 pragmas: Optional[Dict] = None, mode: str = "disk",
+                 flush_interval: float = 0.0):
+        """
+        Args:
+            database_file: path to the database file, defaults to paralympics.db in this package
+            pool_size: maximum number of open database connections
+            pool_timeout: seconds to wait for a free connection
+            pragmas: SQLite pragmas for every connection, overriding data.pool.DEFAULT_PRAGMAS
+            mode: disk, or memory to serve reads from an in-memory copy of the database
+            flush_interval: in memory mode, seconds between copies of the writes back to the file,
+                or 0 to copy them after every commit
+        """
+        if database_file is None:
+            database_file = Path(__file__).parent.joinpath("paralympics.db")
+        self.database_file = Path(database_file)
         if not self.database_file.exists():
             raise FileNotFoundError(f"Database file not found: {self.database_file}")
-        self.tables = []
+        if mode not in ("disk", "memory"):
+            raise ValueError(f"Invalid mode '{mode}', use disk or memory")
+        self.mode = mode
+        self.snapshot: Optional[MemorySnapshot] = None
+        on_commit = None
+        if mode == "memory":
+            self.snapshot = MemorySnapshot(self.database_file, pragmas, flush_interval)
+            self.snapshot.start()
+            if not flush_interval:
+                on_commit = self.snapshot.flush_quietly
+        self._source = self.snapshot.uri if self.snapshot else self.database_file
+        self._uri = self.snapshot is not None
+        self.pool = ConnectionPool(self._source, size=pool_size, timeout=pool_timeout,
+                                   pragmas=pragmas, uri=self._uri)
+        # Every write goes through one connection and thread, see data.writer
+        self.writer = WriteQueue(lambda: connect(self._source, pragmas, uri=self._uri),
+                                 on_commit=on_commit)
+        self.catalog = SchemaCatalog()
+        self.versions = DataVersions()
+        self.filter_usage = Counter()
+        self._usage_lock = threading.Lock()
+        self._all_columns: Optional[List[str]] = None
+        # get_all_data serialized in each format, with the data version it was built from
+        self._materialized: Dict[str, Tuple[str, bytes]] = {}
+        self._materialize_lock = threading.Lock()
+        self._materialize_locks: Dict[str, threading.Lock] = {}
+        self._tracking = self._track_changes()
         try:
-            conn = sqlite3.connect(self.database_file)
-            with conn:
-                cur = conn.cursor()
-                cur.execute(
-                    "SELECT name FROM sqlite_master WHERE type='table' AND name != 'sqlite_master'"
-                )
-                self.tables = [row[0] for row in cur.fetchall()]
+            with self.pool.connection() as conn:
+                self.catalog.load(conn)
         except Exception as e:
             raise RuntimeError(f"Error querying database tables: {e}") from e
+        # Dedicated connection that watches PRAGMA data_version for commits by other connections,
+        # and reads CHANGES_TABLE when it changes
+        self._watcher = sqlite3.connect(self._source, uri=self._uri, check_same_thread=False)
+        self._watched_version: Optional[int] = None
+        self._changes: Dict[str, int] = {}
+        # Change count of each table when it was last checked
+        self._seen: Dict[str, int] = {}
+        self._watch_lock = threading.Lock()
+        with self._watch_lock:
+            self._read_changes()
+            self._seen = {table_name: self._change_count(table_name) for table_name in self.tables}
 
-    def _get_columns(self, table_name: str) -> List[str]:
-        conn = sqlite3.connect(self.database_file)
-        try:
-            cur = conn.cursor()
-            cur.execute(f"PRAGMA table_info('{table_name}')")
-            cols = [row[1] for row in cur.fetchall()]  # the second column is 'name'
-            return cols
-        finally:
-            conn.close()
-
-    def _get_pk_column(self, table_name: str) -> Optional[str]:
-        conn = sqlite3.connect(self.database_file)
-        try:
-            cur = conn.cursor()
-            cur.execute(f"PRAGMA table_info('{table_name}')")
-            for row in cur.fetchall():
-                # row format: (cid, name, type, notnull, dflt_value, pk)
-                if row[5]:  # pk > 0
-                    return row[1]
-            return None
-        finally:
-            conn.close()
+    @property
+    def tables(self) -> List[str]:
+        return [name for name in self.catalog.table_names if name != CHANGES_TABLE]
+
+    def close(self):
+        """ Closes the writer and the pooled database connections, flushing the in-memory copy """
+        self.writer.close()
+        self.pool.close()
+        with self._watch_lock:
+            self._watcher.close()
+        if self.snapshot is not None:
+            self.snapshot.close()
+
+    def _get_schema(self, conn: sqlite3.Connection, table_name: str) -> TableSchema:
+        self.catalog.refresh(conn)
+        return self.catalog.table(table_name)
+
+    def _get_columns(self, conn: sqlite3.Connection, table_name: str) -> List[str]:
+        return self._get_schema(conn, table_name).column_names
+
+    def _get_pk_column(self, conn: sqlite3.Connection, table_name: str) -> Optional[str]:
+        return self._get_schema(conn, table_name).primary_key
 
     def get_table_as_json(self, table_name):
         """ Method to return the specified table data from the paralympics .db file.
@@ -76,12 +178,8 @@ class ParalympicsData:
             json_data: json format data
         """
         try:
-            conn = sqlite3.connect(self.database_file)
-            with conn:
-                conn.row_factory = sqlite3.Row  # Returns columns by names instead of tuples
-                cur = conn.cursor()
-                sql = f"SELECT * from {table_name}"
-                cur.execute(sql)
+            with self.pool.connection() as conn:
+                cur = conn.execute(f"SELECT * from {table_name}")
                 rows = cur.fetchall()
                 if not rows:
                     return []
@@ -89,9 +187,6 @@ class ParalympicsData:
                 return data
         except Exception as e:
             raise RuntimeError(f"Error querying table {table_name}: {e}") from e
-        finally:
-            if conn:
-                conn.close()
 
     def get_all_data(self):
         """ Method to return all data from the paralympics .db file.
@@ -104,22 +199,9 @@ class ParalympicsData:
         Raises:
             e: Exception
         """
-        sql = (
-            "SELECT country.country_name, games.event_type, games.year, games.start_date, "
-            "games.end_date, host.place_name, games.events, games.sports, games.countries, "
-            "games.participants_m, games.participants_f, games.participants, host.latitude, "
-            "host.longitude "
-            "FROM games "
-            "JOIN games_host ON games.id = games_host.games_id "
-            "JOIN host ON games_host.host_id = host.id "
-            "JOIN country ON host.country_id = country.id"
-        )
         try:
-            conn = sqlite3.connect(self.database_file)
-            with conn:
-                conn.row_factory = sqlite3.Row  # Returns columns by names instead of tuples
-                cur = conn.cursor()
-                cur.execute(sql)
+            with self.pool.connection() as conn:
+                cur = conn.execute(ALL_DATA_SQL)
                 rows = cur.fetchall()
                 if not rows:
                     return []
@@ -127,77 +209,492 @@ class ParalympicsData:
                 return data
         except Exception as e:
             raise RuntimeError(f"Error querying tables: {e}") from e
-        finally:
-            if conn:
-                conn.close()
+
+    def _fetch_row(self, conn: sqlite3.Connection, table_name: str, item_id):
+        pk = self._get_pk_column(conn, table_name)
+        if pk:
+            sql = f"SELECT * FROM '{table_name}' WHERE \"{pk}\" = ?"
+        else:
+            sql = f"SELECT * FROM '{table_name}' WHERE rowid = ?"
+        row = conn.execute(sql, (item_id,)).fetchone()
+        return dict(row) if row else None
 
     def get_row_by_id(self, table_name: str, item_id):
         if table_name not in self.tables:
             raise RuntimeError(f"Table {table_name} does not exist")
-        pk = self._get_pk_column(table_name)
-        conn = sqlite3.connect(self.database_file)
-        try:
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            if pk:
-                sql = f"SELECT * FROM '{table_name}' WHERE \"{pk}\" = ?"
-            else:
-                sql = f"SELECT * FROM '{table_name}' WHERE rowid = ?"
-            cur.execute(sql, (item_id,))
-            row = cur.fetchone()
-            return dict(row) if row else None
-        finally:
-            conn.close()
+        with self.pool.connection() as conn:
+            return self._fetch_row(conn, table_name, item_id)
 
     def search_table(self, table_name: str, filters: Dict[str, str]):
+        rows, _ = self.query_table(table_name, filters)
+        return rows
+
+    def query_table(self, table_name: str, filters: Optional[Dict[str, str]] = None,
+                    fields: Optional[List[str]] = None, limit: Optional[int] = None, after=None,
+                    order_by: Optional[str] = None):
+        """ Method to return rows from a table, optionally filtered, sorted, projected and paged.
+
+        Filters are compiled into SQL by data.filters: a plain column name matches exactly, and
+        suffixes such as year__gte=2000 or year__in=2012,2016 select ranges and lists. Plain keys
+        that are not columns are ignored.
+
+        When limit or after is given without order_by the rows are returned in primary key order
+        (rowid if the table has no primary key) using keyset pagination: pass the returned cursor
+        as after to get the next page. Only limit + 1 rows are read for each page. With order_by,
+        limit returns the first rows in that order and there is no next page cursor.
+
+        Args:
+            table_name: name of the database table, or ALL_DATA for the get_all_data rows
+            filters: dict of filter key to value, see data.filters
+            fields: list of the columns to return, defaults to all columns
+            limit: maximum number of rows to return
+            after: cursor returned with the previous page
+            order_by: comma separated columns to sort by, prefixed with - for descending order
+
+        Returns:
+            (rows, next_cursor): list of row dicts, and the cursor for the next page or None if
+            there are no more rows
+
+        Raises:
+            ValueError: for an unknown field, filter or order_by column, an invalid filter value,
+            limit less than 1, or after combined with order_by
+        """
+        with self.pool.connection() as conn:
+            sql, values, key = self._build_select(conn, table_name, filters, fields, limit, after,
+                                                  with_cursor=True, order_by=order_by)
+            rows = conn.execute(sql, values).fetchall()
+        if key is None:
+            return [dict(r) for r in rows], None
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][0]
+        return [dict(zip(r.keys()[1:], tuple(r)[1:])) for r in rows], next_cursor
+
+    def _build_select(self, conn: sqlite3.Connection, table_name: str, filters, fields, limit,
+                      after, with_cursor: bool = False, order_by: Optional[str] = None):
+        """ Builds the SELECT statement for query_table and stream_table.
+
+        table_name may be ALL_DATA to select from the get_all_data join; that data has no key, so it
+        can be sorted and limited but not paged with after.
+
+        Returns:
+            (sql, values, key): the parameterized SQL, its values, and the keyset pagination column
+            (None if the query is not paged). With with_cursor=True a paged query selects the key
+            as the first column, and one row more than limit so the caller can tell if there is
+            another page.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be at least 1")
+        if order_by and after is not None:
+            raise ValueError("after cannot be combined with order_by")
+        if table_name == ALL_DATA and after is not None:
+            raise ValueError("after is not supported for the all data")
+        source, cols, primary_key = self._get_source(conn, table_name)
+        if fields:
+            unknown = [f for f in fields if f not in cols]
+            if unknown:
+                raise ValueError(f"Unknown field(s) for {table_name}: {', '.join(unknown)}")
+            select = ", ".join(f"\"{f}\"" for f in fields)
+        else:
+            select = "*"
+        where_clauses, values, filtered = compile_filters(filters or {}, cols)
+        if filtered and table_name != ALL_DATA:
+            self._record_filter(table_name, filtered)
+        order = compile_order_by(order_by, cols) if order_by else None
+        key = None
+        if order is None and table_name != ALL_DATA and (limit is not None or after is not None):
+            key = f"\"{primary_key}\"" if primary_key else "rowid"
+            if with_cursor:
+                select = f"{key} AS _cursor, {select}"
+            if after is not None:
+                where_clauses.append(f"{key} > ?")
+                values.append(after)
+        sql = f"SELECT {select} FROM {source}"
+        if where_clauses:
+            sql += " WHERE " + " AND ".join(where_clauses)
+        if key is not None or order is not None:
+            sql += f" ORDER BY {key or order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            values.append(limit + 1 if with_cursor and key is not None else limit)
+        return sql, tuple(values), key
+
+    def _get_source(self, conn: sqlite3.Connection, table_name: str):
+        """ Returns the FROM clause source, column names and primary key for a table or ALL_DATA """
+        if table_name == ALL_DATA:
+            return f"({ALL_DATA_SQL})", self._all_data_columns(conn), None
         if table_name not in self.tables:
             raise RuntimeError(f"Table {table_name} does not exist")
-        cols = set(self._get_columns(table_name))
-        allowed_filters = {k: v for k, v in filters.items() if k in cols}
-        if not allowed_filters:
-            return self.get_table_as_json(table_name)
-        where_clauses = []
-        values = []
-        for col, val in allowed_filters.items():
-            where_clauses.append(f"\"{col}\" = ?")
-            values.append(val)
-        sql = f"SELECT * FROM '{table_name}' WHERE " + " AND ".join(where_clauses)
-        conn = sqlite3.connect(self.database_file)
+        schema = self._get_schema(conn, table_name)
+        return f"'{table_name}'", schema.column_names, schema.primary_key
+
+    def _build_aggregate(self, conn: sqlite3.Connection, table_name: str, group_by, metrics,
+                         filters, order_by, limit):
+        """ Builds the GROUP BY statement for aggregate_table and stream_aggregate """
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be at least 1")
+        source, cols, _ = self._get_source(conn, table_name)
+        groups = compile_group_by(group_by, cols)
+        compiled = compile_metrics(metrics, cols)
+        select = [f"\"{g}\"" for g in groups] + [f"{sql} AS \"{name}\"" for sql, name in compiled]
+        where_clauses, values, filtered = compile_filters(filters or {}, cols)
+        if filtered and table_name != ALL_DATA:
+            self._record_filter(table_name, filtered)
+        sql = f"SELECT {', '.join(select)} FROM {source}"
+        if where_clauses:
+            sql += " WHERE " + " AND ".join(where_clauses)
+        if groups:
+            sql += " GROUP BY " + ", ".join(f"\"{g}\"" for g in groups)
+        if order_by:
+            sql += " ORDER BY " + compile_order_by(order_by, groups + [n for _, n in compiled])
+        elif groups:
+            sql += " ORDER BY " + ", ".join(f"\"{g}\"" for g in groups)
+        if limit is not None:
+            sql += " LIMIT ?"
+            values.append(limit)
+        return sql, tuple(values)
+
+    def aggregate_table(self, table_name: str, group_by: Optional[str], metrics: str,
+                        filters: Optional[Dict[str, str]] = None, order_by: Optional[str] = None,
+                        limit: Optional[int] = None):
+        """ Method to return metrics, such as sums and ratios, for groups of rows in a table.
+
+        The grouping and metrics run in SQLite so only one row per group is returned. See
+        data.aggregates for the metric syntax.
+
+        Args:
+            table_name: name of the database table, or ALL_DATA for the get_all_data rows
+            group_by: comma separated columns to group by, or None for one row of totals
+            metrics: comma separated metrics, e.g. "sum(participants),ratio(participants_f,participants)"
+            filters: dict of filter key to value applied before grouping, see data.filters
+            order_by: group by or metric columns to sort by, defaults to the group by columns
+            limit: maximum number of groups to return
+
+        Returns:
+            rows: list of dicts with the group by columns and a column for each metric
+
+        Raises:
+            ValueError: for an unknown column, function or filter, or limit less than 1
+        """
+        with self.pool.connection() as conn:
+            sql, values = self._build_aggregate(conn, table_name, group_by, metrics, filters,
+                                                order_by, limit)
+            return [dict(r) for r in conn.execute(sql, values).fetchall()]
+
+    def stream_aggregate(self, table_name: str, group_by: Optional[str], metrics: str,
+                         filters: Optional[Dict[str, str]] = None, order_by: Optional[str] = None,
+                         limit: Optional[int] = None, batch_size: int = 500) -> Iterator:
+        """ Method to stream the aggregate_table rows in batches; see stream_table """
+        with self.pool.connection() as conn:
+            sql, values = self._build_aggregate(conn, table_name, group_by, metrics, filters,
+                                                order_by, limit)
+        return self._iter_batches(sql, values, batch_size)
+
+    def _all_data_columns(self, conn: sqlite3.Connection) -> List[str]:
+        """ Returns the column names of the get_all_data rows """
+        if self._all_columns is None:
+            cur = conn.execute(f"SELECT * FROM ({ALL_DATA_SQL}) LIMIT 0")
+            self._all_columns = [d[0] for d in cur.description]
+        return self._all_columns
+
+    def _record_filter(self, table_name: str, columns: List[str]):
+        """ Counts a search on the columns, for the index advisor """
+        with self._usage_lock:
+            self.filter_usage[(table_name, tuple(sorted(columns)))] += 1
+
+    def stream_table(self, table_name: str, filters: Optional[Dict[str, str]] = None,
+                     fields: Optional[List[str]] = None, limit: Optional[int] = None, after=None,
+                     order_by: Optional[str] = None, batch_size: int = 500) -> Iterator:
+        """ Method to stream rows from a table in batches rather than building the whole result.
+
+        Takes the same arguments as query_table. The query is checked before anything is returned,
+        so errors such as unknown fields are raised immediately rather than part way through.
+
+        Returns:
+            batches: iterator that yields the list of column names, then lists of up to batch_size
+            row tuples
+        """
+        with self.pool.connection() as conn:
+            sql, values, _ = self._build_select(conn, table_name, filters, fields, limit, after,
+                                                order_by=order_by)
+        return self._iter_batches(sql, values, batch_size)
+
+    def stream_all_data(self, batch_size: int = 500) -> Iterator:
+        """ Method to stream the get_all_data rows in batches; see stream_table """
+        return self._iter_batches(ALL_DATA_SQL, (), batch_size)
+
+    def _track_changes(self) -> bool:
+        """ Adds the triggers that count the rows changed in each table to CHANGES_TABLE
+
+        The triggers are stored in the database, so they count writes made by any connection.
+
+        Returns:
+            tracking: False if they could not be added, e.g. because the database is read-only
+        """
+        def write(conn):
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} "
+                         "(table_name TEXT PRIMARY KEY, changes INTEGER NOT NULL)")
+            names = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name != ? "
+                "AND name NOT LIKE 'sqlite^_%' ESCAPE '^'", (CHANGES_TABLE,))]
+            for name in names:
+                literal, identifier = name.replace("'", "''"), name.replace('"', '""')
+                for op in ("INSERT", "UPDATE", "DELETE"):
+                    conn.execute(
+                        f"CREATE TRIGGER IF NOT EXISTS \"{CHANGES_TABLE}_{identifier}_{op.lower()}\" "
+                        f"AFTER {op} ON \"{identifier}\" BEGIN "
+                        f"INSERT INTO {CHANGES_TABLE} VALUES ('{literal}', 1) "
+                        "ON CONFLICT (table_name) DO UPDATE SET changes = changes + 1; END")
+
         try:
-            conn.row_factory = sqlite3.Row
+            self.writer.submit(write)
+        except sqlite3.Error:
+            return False
+        return True
+
+    def _read_changes(self):
+        """ Reads CHANGES_TABLE on the watcher connection if anything has been committed since """
+        version = self._watcher.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._watched_version:
+            if self._tracking:
+                self._changes = dict(
+                    self._watcher.execute(f"SELECT table_name, changes FROM {CHANGES_TABLE}"))
+            self._watched_version = version
+
+    def _change_count(self, table_name: str) -> int:
+        if self._tracking:
+            return self._changes.get(table_name, 0)
+        # Without the triggers any commit may have changed any table
+        return self._watched_version
+
+    def detect_external_writes(self, tables: Optional[Iterable[str]] = None) -> bool:
+        """ Method to check whether another connection has changed some tables.
+
+        Triggers count the rows changed in each table in CHANGES_TABLE, whichever connection
+        changes them, so this also notices writes made outside this class, e.g. by another API
+        worker process or the sqlite3 shell. The count is only read when ``PRAGMA data_version``
+        on a dedicated connection shows that another connection has committed, so a check costs
+        one pragma and, after a commit, one read of a row per table, however big the tables are.
+        If the triggers could not be added every commit counts as a change to every table.
+
+        Args:
+            tables: names of the tables to check, defaults to every table
+
+        Returns:
+            changed: True if a change to one of the tables was detected
+        """
+        changed = []
+        with self._watch_lock:
+            self._read_changes()
+            for table_name in (self.tables if tables is None else tables):
+                count = self._change_count(table_name)
+                if self._seen.get(table_name, 0) != count:
+                    changed.append(table_name)
+                    self._seen[table_name] = count
+        if changed:
+            self.versions.bump(*changed)
+        return bool(changed)
+
+    def _wrote(self, *tables: str):
+        """ Bumps the versions of tables written by this instance after the write is committed """
+        # The write changed their counts too; mark them seen so the next check does not bump them
+        # again. The bump below also covers any other writes to them counted by then.
+        with self._watch_lock:
+            self._read_changes()
+            for table_name in tables:
+                self._seen[table_name] = self._change_count(table_name)
+        self.versions.bump(*tables)
+
+    def get_all_data_bytes(self, fmt: str = "json") -> bytes:
+        """ Method to return the get_all_data rows serialized in a response format.
+
+        The join runs and its result is serialized once; the bytes are then reused until the data
+        version of ALL_DATA_TABLES changes, i.e. after add_row writes to one of those tables or
+        detect_external_writes finds a change.
+
+        Args:
+            fmt: json or one of the other formats in data.formats.ENCODERS
+
+        Returns:
+            body: the serialized rows
+        """
+        self.detect_external_writes(ALL_DATA_TABLES)
+        with self._materialize_lock:
+            lock = self._materialize_locks.setdefault(fmt, threading.Lock())
+        with lock:  # only one request rebuilds each format
+            # Read the version before the query, so a write during the rebuild makes it stale
+            version = self.versions.version(ALL_DATA_TABLES)
+            cached = self._materialized.get(fmt)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            body = b"".join(ENCODERS[fmt](self.stream_all_data()))
+            self._materialized[fmt] = (version, body)
+            return body
+
+    def _iter_batches(self, sql: str, values: tuple, batch_size: int) -> Iterator:
+        if self.snapshot is not None:
+            # An in-memory database cannot use WAL, so an open read would block the writer for as
+            # long as the client takes to read the stream. The rows are in memory anyway, so they
+            # are all read before the first batch is returned.
+            with self.pool.connection() as conn:
+                cur = conn.cursor()
+                cur.row_factory = None
+                cur.execute(sql, values)
+                columns = [d[0] for d in cur.description]
+                rows = cur.fetchall()
+            yield columns
+            for start in range(0, len(rows), batch_size):
+                yield rows[start:start + batch_size]
+            return
+        # The connection is held until the generator is exhausted or closed
+        with self.pool.connection() as conn:
             cur = conn.cursor()
-            cur.execute(sql, tuple(values))
-            rows = cur.fetchall()
-            return [dict(r) for r in rows]
-        finally:
-            conn.close()
+            cur.row_factory = None  # plain tuples, no per-row Row or dict objects
+            cur.execute(sql, values)
+            yield [d[0] for d in cur.description]
+            while True:
+                batch = cur.fetchmany(batch_size)
+                if not batch:
+                    return
+                yield batch
+
+    def get_quiz_question(self, question_id):
+        """ Method to return a quiz question with its responses and the total number of questions.
+
+        Uses a single query. The question count is always returned, even if there is no question
+        with the given id.
+
+        Args:
+            question_id: id of the question
+
+        Returns:
+            data: dict with question_count, question (None if not found) and a list of responses
+        """
+        sql = (
+            "SELECT c.question_count, q.id, q.question_text, r.id AS response_id, "
+            "r.response_text, r.is_correct "
+            "FROM (SELECT COUNT(*) AS question_count FROM question) AS c "
+            "LEFT JOIN question AS q ON q.id = ? "
+            "LEFT JOIN response AS r ON r.question_id = q.id "
+            "ORDER BY r.id"
+        )
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute(sql, (question_id,)).fetchall()
+        except Exception as e:
+            raise RuntimeError(f"Error querying quiz question {question_id}: {e}") from e
+        first = rows[0]
+        question = None
+        if first["id"] is not None:
+            question = {"id": first["id"], "question_text": first["question_text"]}
+        responses = [
+            {"id": row["response_id"], "question_id": row["id"],
+             "response_text": row["response_text"], "is_correct": row["is_correct"]}
+            for row in rows if row["response_id"] is not None
+        ]
+        return {"question_count": first["question_count"], "question": question,
+                "responses": responses}
+
+    def get_quiz(self):
+        """ Method to return every quiz question with its responses, and the number of questions.
+
+        Uses a single query, so the questions and responses are read from the same snapshot of the
+        database.
+
+        Returns:
+            data: dict with question_count and a list of questions in id order, each with its list
+            of responses
+        """
+        sql = (
+            "SELECT q.id, q.question_text, r.id AS response_id, r.response_text, r.is_correct "
+            "FROM question AS q "
+            "LEFT JOIN response AS r ON r.question_id = q.id "
+            "ORDER BY q.id, r.id"
+        )
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute(sql).fetchall()
+        except Exception as e:
+            raise RuntimeError(f"Error querying quiz questions: {e}") from e
+        questions: Dict[int, Dict] = {}
+        for row in rows:
+            question = questions.setdefault(
+                row["id"], {"id": row["id"], "question_text": row["question_text"], "responses": []})
+            if row["response_id"] is not None:
+                question["responses"].append(
+                    {"id": row["response_id"], "question_id": row["id"],
+                     "response_text": row["response_text"], "is_correct": row["is_correct"]})
+        return {"question_count": len(questions), "questions": list(questions.values())}
+
+    def add_quiz_question(self, question: Dict, responses: List[Dict]):
+        """ Method to add a question and its responses in a single transaction.
+
+        Either the question and all of its responses are saved, or nothing is. Unknown keys are
+        ignored and the question_id of each response is set to the new question's id.
+
+        Args:
+            question: values for the question table
+            responses: list of values for the response table
+
+        Returns:
+            data: dict with the inserted question and the list of inserted responses
+        """
+        with self.pool.connection() as conn:
+            q_cols = self._get_columns(conn, "question")
+            r_cols = [c for c in self._get_columns(conn, "response") if c not in ("id", "question_id")]
+            q_data = {k: v for k, v in question.items() if k in q_cols}
+            if not q_data:
+                raise RuntimeError("No valid columns provided for insert")
+            columns = ", ".join(f"\"{c}\"" for c in q_data.keys())
+            placeholders = ", ".join("?" for _ in q_data)
+            # Responses are inserted with only the columns they give, so the others get their
+            # defaults; each run of responses with the same columns is one executemany, in order
+            r_groups = []
+            for used, group in itertools.groupby(
+                    responses, key=lambda r: tuple(c for c in r_cols if c in r)):
+                r_columns = ", ".join(f"\"{c}\"" for c in ["question_id", *used])
+                r_placeholders = ", ".join("?" for _ in range(len(used) + 1))
+                r_groups.append((f"INSERT INTO response ({r_columns}) VALUES ({r_placeholders})",
+                                 used, list(group)))
+
+        def write(conn):
+            cur = conn.execute(f"INSERT INTO question ({columns}) VALUES ({placeholders})",
+                               tuple(q_data.values()))
+            question_id = cur.lastrowid
+            for sql, used, group in r_groups:
+                conn.executemany(sql, [(question_id, *(r[c] for c in used)) for r in group])
+            rows = conn.execute("SELECT * FROM response WHERE question_id = ? ORDER BY id",
+                                (question_id,)).fetchall()
+            return {"question": self._fetch_row(conn, "question", question_id),
+                    "responses": [dict(r) for r in rows]}
+
+        # Returns once committed; the question and its responses are rolled back together on error
+        result = self.writer.submit(write)
+        self._wrote("question", "response")
+        return result
 
     def add_row(self, table_name: str, row: Dict):
         if table_name not in self.tables:
             raise RuntimeError(f"Table {table_name} does not exist")
-        cols = self._get_columns(table_name)
-        # Keep only known columns
-        data = {k: v for k, v in row.items() if k in cols}
-        if not data:
-            raise RuntimeError("No valid columns provided for insert")
-        columns = ", ".join(f"\"{c}\"" for c in data.keys())
-        placeholders = ", ".join("?" for _ in data)
-        sql = f"INSERT INTO '{table_name}' ({columns}) VALUES ({placeholders})"
-        conn = sqlite3.connect(self.database_file)
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, tuple(data.values()))
-            conn.commit()
-            last_id = cur.lastrowid
-            # return the inserted row (by primary key if available)
-            pk = self._get_pk_column(table_name)
-            if pk:
-                return self.get_row_by_id(table_name, last_id)
-            else:
-                # no pk, return the last inserted row via rowid
-                return self.get_row_by_id(table_name, last_id)
-        finally:
-            conn.close()
+        with self.pool.connection() as conn:
+            cols = self._get_columns(conn, table_name)
+            # Keep only known columns
+            data = {k: v for k, v in row.items() if k in cols}
+            if not data:
+                raise RuntimeError("No valid columns provided for insert")
+            columns = ", ".join(f"\"{c}\"" for c in data.keys())
+            placeholders = ", ".join("?" for _ in data)
+            sql = f"INSERT INTO '{table_name}' ({columns}) VALUES ({placeholders})"
+
+        def write(conn):
+            cur = conn.execute(sql, tuple(data.values()))
+            # return the inserted row (by primary key if available, otherwise via rowid)
+            return self._fetch_row(conn, table_name, cur.lastrowid)
+
+        row = self.writer.submit(write)
+        self._wrote(table_name)
+        return row
 
 
 # Example of a function that gets data from an excel file and returns in JSON format
@@ -0,0 +1,198 @@
+""" A small bounded pool of persistent SQLite connections.
+
+Opening a SQLite connection is relatively expensive compared to the queries the mock API runs,
+so connections are opened on demand up to a maximum size and then reused.
+
+Every connection is opened with the same pragmas, see :func:`connect`. By default the database is
+put in WAL mode, so readers keep reading the last committed data while a write is in progress
+instead of waiting for it.
+
+"""
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+
+# Pragmas applied to each new connection unless overridden. synchronous=NORMAL is safe in WAL mode:
+# a power failure can lose the last commits but cannot corrupt the database. A negative cache_size
+# is in KiB, and mmap_size=0 turns memory-mapped I/O off.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "cache_size": -16000,
+    "mmap_size": 0,
+    "busy_timeout": 5000,
+}
+# Accepted values of the pragmas that take a keyword; the others take an integer
+PRAGMA_CHOICES = {
+    "journal_mode": ("delete", "truncate", "persist", "memory", "wal", "off"),
+    "synchronous": ("off", "normal", "full", "extra"),
+}
+INTEGER_PRAGMAS = ("cache_size", "mmap_size", "busy_timeout")
+
+
+def pragma_statements(pragmas: Optional[Dict] = None) -> list:
+    """ Returns the PRAGMA statements for DEFAULT_PRAGMAS updated with pragmas
+
+    Raises:
+        ValueError: for an unknown pragma or a value it does not accept
+    """
+    settings = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+    statements = []
+    for name, value in settings.items():
+        if value is None:
+            continue
+        if name in PRAGMA_CHOICES:
+            value = str(value).lower()
+            if value not in PRAGMA_CHOICES[name]:
+                raise ValueError(f"Invalid {name} '{value}', use one of: "
+                                 f"{', '.join(PRAGMA_CHOICES[name])}")
+        elif name in INTEGER_PRAGMAS:
+            value = int(value)
+        else:
+            raise ValueError(f"Unsupported pragma: {name}")
+        statements.append(f"PRAGMA {name} = {value}")
+    return statements
+
+
+def connect(database_file: Union[str, Path], pragmas: Optional[Dict] = None,
+            **kwargs) -> sqlite3.Connection:
+    """ Opens a connection that returns sqlite3.Row rows and applies the pragmas
+
+    Args:
+        database_file: path to the database file
+        pragmas: pragma values that override DEFAULT_PRAGMAS, a value of None leaves it unset
+        **kwargs: passed to sqlite3.connect
+    """
+    conn = sqlite3.connect(database_file, **kwargs)
+    conn.row_factory = sqlite3.Row  # Returns columns by names instead of tuples
+    try:
+        for statement in pragma_statements(pragmas):
+            conn.execute(statement)
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+class ConnectionPool:
+    """ Bounded pool of persistent SQLite connections.
+
+    Connections are created lazily, up to ``size``, and returned to the pool after use. Each
+    connection is checked with a trivial query when it is taken from the pool and is replaced if
+    it is no longer usable.
+
+    Attributes:
+        database_file: path to the database file
+        size: maximum number of open connections
+        timeout: seconds to wait for a free connection before giving up
+        pragmas: pragma values applied to each connection, see DEFAULT_PRAGMAS
+        uri: True if database_file is a file: URI, e.g. of an in-memory database
+
+    Methods:
+        connection(self): Context manager that borrows a connection from the pool
+        close(self): Closes all connections; the pool cannot be used afterwards
+    """
+
+    def __init__(self, database_file: Union[str, Path], size: int = 5, timeout: float = 5.0,
+                 pragmas: Optional[Dict] = None, uri: bool = False):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        pragma_statements(pragmas)  # fail now rather than on the first connection
+        self.database_file = database_file
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = pragmas
+        self.uri = uri
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are handed between threads, but only ever used by one thread at a time
+        return connect(self.database_file, self.pragmas, timeout=self.timeout,
+                       check_same_thread=False, uri=self.uri)
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+
+    def acquire(self) -> sqlite3.Connection:
+        """ Takes a healthy connection from the pool, opening a new one if the pool is not full.
+
+        Raises:
+            RuntimeError: if the pool is closed or no connection becomes free within the timeout
+        """
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise RuntimeError(
+                    f"Timed out after {self.timeout}s waiting for a database connection"
+                ) from None
+        if not self._is_healthy(conn):
+            self._discard(conn)
+            return self.acquire()
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """ Returns a connection to the pool, rolling back anything left uncommitted. """
+        if self._closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """ Borrows a connection for the duration of a ``with`` block. """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """ Closes all idle connections. Connections still in use are closed when released. """
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
@@ -0,0 +1,119 @@
+""" In-memory catalog of the database schema.
+
+The schema is read once with the SQLite PRAGMA functions and kept in memory so that queries do not
+need to look up column names or primary keys each time. The catalog is reloaded if
+``PRAGMA schema_version`` shows that the schema has changed since it was read.
+
+"""
+import sqlite3
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class ColumnInfo(NamedTuple):
+    """ A table column as reported by ``PRAGMA table_info`` """
+    name: str
+    type: str
+    notnull: bool
+    default: Optional[str]
+    pk: int
+
+
+class ForeignKey(NamedTuple):
+    """ A foreign key column and the table column it references """
+    column: str
+    ref_table: str
+    ref_column: Optional[str]
+
+
+class IndexInfo(NamedTuple):
+    """ An index on a table and the columns it covers, in order """
+    name: str
+    columns: Tuple[str, ...]
+    unique: bool
+
+
+class TableSchema(NamedTuple):
+    """ Schema details for one table """
+    name: str
+    columns: Tuple[ColumnInfo, ...]
+    primary_key: Optional[str]
+    foreign_keys: Tuple[ForeignKey, ...]
+    indexes: Tuple[IndexInfo, ...]
+
+    @property
+    def column_names(self) -> List[str]:
+        return [c.name for c in self.columns]
+
+    def column(self, name: str) -> Optional[ColumnInfo]:
+        return next((c for c in self.columns if c.name == name), None)
+
+
+def _read_table(conn: sqlite3.Connection, table_name: str) -> TableSchema:
+    # table_info row format: (cid, name, type, notnull, dflt_value, pk)
+    columns = tuple(
+        ColumnInfo(row[1], row[2].upper(), bool(row[3]), row[4], row[5])
+        for row in conn.execute(f"PRAGMA table_info('{table_name}')")
+    )
+    pk = next((c.name for c in sorted(columns, key=lambda c: c.pk) if c.pk), None)
+    # foreign_key_list row format: (id, seq, table, from, to, on_update, on_delete, match)
+    foreign_keys = tuple(
+        ForeignKey(row[3], row[2], row[4])
+        for row in conn.execute(f"PRAGMA foreign_key_list('{table_name}')")
+    )
+    indexes = []
+    # index_list row format: (seq, name, unique, origin, partial)
+    for row in conn.execute(f"PRAGMA index_list('{table_name}')").fetchall():
+        # index_info row format: (seqno, cid, name)
+        cols = tuple(r[2] for r in conn.execute(f"PRAGMA index_info('{row[1]}')"))
+        indexes.append(IndexInfo(row[1], cols, bool(row[2])))
+    return TableSchema(table_name, columns, pk, foreign_keys, tuple(indexes))
+
+
+class SchemaCatalog:
+    """ Cached schema for every table in a database.
+
+    Attributes:
+        schema_version: value of ``PRAGMA schema_version`` when the catalog was last loaded
+
+    Methods:
+        load(self, conn): Reads the schema for all tables
+        refresh(self, conn): Reloads the schema only if the schema version has changed
+        table(self, table_name): Returns the TableSchema for a table
+    """
+
+    def __init__(self):
+        self.schema_version = None
+        self._tables: Dict[str, TableSchema] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def table_names(self) -> List[str]:
+        return list(self._tables)
+
+    @staticmethod
+    def _version(conn: sqlite3.Connection) -> int:
+        return conn.execute("PRAGMA schema_version").fetchone()[0]
+
+    def load(self, conn: sqlite3.Connection):
+        """ Reads the schema of every table in the database. """
+        with self._lock:
+            version = self._version(conn)
+            names = [
+                row[0] for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name != 'sqlite_master'"
+                )
+            ]
+            self._tables = {name: _read_table(conn, name) for name in names}
+            self.schema_version = version
+
+    def refresh(self, conn: sqlite3.Connection):
+        """ Reloads the catalog if the database schema has changed since it was loaded. """
+        if self._version(conn) != self.schema_version:
+            self.load(conn)
+
+    def table(self, table_name: str) -> TableSchema:
+        try:
+            return self._tables[table_name]
+        except KeyError:
+            raise RuntimeError(f"Table {table_name} does not exist") from None
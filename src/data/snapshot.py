@@ -0,0 +1,145 @@
+""" An in-memory copy of the database that is written back to the database file.
+
+Most of the paralympics data never changes once loaded, so in ``memory`` mode ParalympicsData
+copies the whole database file into a shared in-memory database (``vfs=memdb``, SQLite 3.36 or
+later) when it starts. Every connection then reads from memory rather than from the file.
+
+Writes are made to the in-memory database and copied back to the file with the backup API, either
+after every commit (``flush_interval=0``) or at most once every ``flush_interval`` seconds. With
+an interval, writes since the last flush are lost if the process stops without calling close.
+A flush that fails, e.g. because another process has the file locked, does not undo or fail the
+writes: the error is kept in ``last_error`` and the next flush copies them.
+
+The in-memory database is the only copy that is read, so changes made to the file by other
+processes are not seen, and are overwritten by the next flush.
+
+"""
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from data.pool import connect
+
+
+class MemorySnapshot:
+    """ A shared in-memory copy of a database file, flushed back to the file after writes.
+
+    Attributes:
+        database_file: path to the database file that is copied and flushed to
+        uri: URI of the in-memory database, open it with sqlite3.connect(uri, uri=True)
+        flush_interval: seconds between flushes, or 0 to flush only when flush is called
+        flushes: number of times the database has been copied back to the file
+        last_error: the error raised by the last failed flush_quietly, if any
+
+    Methods:
+        flush(self): Copies the in-memory database to the file if it has changed
+        flush_quietly(self): Calls flush, keeping any error in last_error rather than raising it
+        start(self): Starts the background thread that flushes every flush_interval seconds
+        close(self): Stops the background thread, flushes and frees the in-memory database
+    """
+
+    def __init__(self, database_file: Union[str, Path], pragmas: Optional[Dict] = None,
+                 flush_interval: float = 0.0):
+        self.database_file = database_file
+        self.pragmas = pragmas
+        self.flush_interval = flush_interval
+        # A memdb name starting with / is shared by every connection in this process
+        self.uri = f"file:/paralympics-{uuid.uuid4().hex}?vfs=memdb"
+        self.flushes = 0
+        self.last_error: Optional[Exception] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Keeps the in-memory database alive, and never writes, so its PRAGMA data_version
+        # changes whenever another connection commits
+        self._conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        self._load()
+        self._flushed_version = self._data_version()
+
+    def _load(self):
+        disk = connect(self.database_file, self.pragmas)
+        try:
+            image = bytearray(disk.serialize())
+        finally:
+            disk.close()
+        # Header bytes 18 and 19 are 2 in a WAL mode database, and an in-memory database with them
+        # cannot be opened, so they are set back to 1 (rollback journal) before the copy. Flushing
+        # to a WAL mode file sets them to 2 again.
+        image[18:20] = b"\x01\x01"
+        staging = sqlite3.connect(":memory:")
+        try:
+            staging.deserialize(bytes(image))
+            staging.backup(self._conn)
+        finally:
+            staging.close()
+
+    def _data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    @staticmethod
+    def _give_up_after(disk: sqlite3.Connection):
+        # backup() retries for as long as the file is locked; this stops it once the connection's
+        # busy timeout has passed, as any other statement would
+        deadline = time.monotonic() + disk.execute("PRAGMA busy_timeout").fetchone()[0] / 1000
+
+        def progress(status, remaining, total):
+            locked = status in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+            if locked and time.monotonic() > deadline:
+                raise sqlite3.OperationalError("database is locked")
+
+        return progress
+
+    def flush(self) -> bool:
+        """ Copies the in-memory database to the database file if it has changed since the last flush
+
+        Returns:
+            flushed: True if the database was copied
+        """
+        with self._lock:
+            if self._conn is None:
+                return False
+            version = self._data_version()
+            if version == self._flushed_version:
+                return False
+            disk = connect(self.database_file, self.pragmas)
+            try:
+                self._conn.backup(disk, progress=self._give_up_after(disk))
+            finally:
+                disk.close()
+            self._flushed_version = version
+            self.flushes += 1
+            return True
+
+    def flush_quietly(self) -> bool:
+        try:
+            flushed = self.flush()
+        except sqlite3.Error as e:
+            # The file may be locked by another process; the next flush tries again
+            self.last_error = e
+            return False
+        self.last_error = None
+        return flushed
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush_quietly()
+
+    def start(self):
+        if self.flush_interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="paralympics-flush",
+                                            daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,51 @@
+""" Version numbers for the data in each table, used to validate cached responses.
+
+Each write through ParalympicsData bumps the version of the tables it changed, and
+ParalympicsData.detect_external_writes bumps the versions of tables changed by other connections
+or processes. A version string for a set of tables changes whenever any of those tables changes,
+so it can be used to build HTTP ETags. The string starts with a token that is unique to this
+instance, so versions from a restarted server never match those handed out before the restart.
+
+"""
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Iterable
+
+
+class DataVersions:
+    """ Version number and last modified time for each table.
+
+    Attributes:
+        token: random identifier for this instance, included in every version string
+
+    Methods:
+        bump(self, *tables): Records a change to the tables
+        version(self, tables): Returns a version string for a set of tables
+        last_modified(self, tables): Returns the time of the latest change to a set of tables
+    """
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex[:12]
+        self._started = time.time()
+        self._versions = defaultdict(int)
+        self._modified = {}
+        self._lock = threading.Lock()
+
+    def bump(self, *tables: str):
+        now = time.time()
+        with self._lock:
+            for table in tables:
+                self._versions[table] += 1
+                self._modified[table] = now
+
+    def version(self, tables: Iterable[str]) -> str:
+        with self._lock:
+            numbers = ".".join(str(self._versions[t]) for t in sorted(tables))
+        return f"{self.token}-{numbers}"
+
+    def last_modified(self, tables: Iterable[str]) -> float:
+        with self._lock:
+            return max((self._modified.get(t, self._started) for t in tables),
+                       default=self._started)
@@ -0,0 +1,158 @@
+""" A single writer thread that commits queued writes together.
+
+SQLite allows one writer at a time, so writes from many threads would otherwise queue on the
+database lock, and each would pay for its own commit. Instead every write is submitted to one
+thread that owns the only writing connection. The thread takes all the writes waiting in the
+queue, up to ``max_batch``, runs them in one transaction and commits once ("group commit").
+
+Each write runs inside its own savepoint, so a write that fails is rolled back on its own and the
+rest of the batch is still committed. The caller of :meth:`WriteQueue.submit` gets its result only
+once the batch has been committed, and the ``on_commit`` callback, if any, has returned.
+
+"""
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+_STOP = object()
+
+
+class WriteQueue:
+    """ Serializes writes through one thread and connection, committing them in batches.
+
+    Attributes:
+        connect: function that opens the writing connection, called in the writer thread
+        max_batch: largest number of writes committed together
+        timeout: seconds submit waits for a write to be committed
+        on_commit: function called in the writer thread after each commit, e.g. to copy the
+            changes elsewhere. The writes are already committed, so they return their results
+            even if it fails; it should report its own errors
+        commits: number of transactions committed so far
+
+    Methods:
+        submit(self, func): Runs func(conn) in the writer thread and returns its result
+        close(self): Commits the writes already submitted, then stops the writer thread
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_batch: int = 64,
+                 timeout: Optional[float] = 30.0,
+                 on_commit: Optional[Callable[[], object]] = None):
+        self.connect = connect
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.on_commit = on_commit
+        self.commits = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def submit(self, func: Callable[[sqlite3.Connection], object]):
+        """ Runs func(conn) in the writer thread and returns its result once it is committed
+
+        func must only use the connection it is given, and must not commit or roll back.
+
+        Raises:
+            RuntimeError: if the queue is closed
+            TimeoutError: if the write is not committed within the timeout
+            Exception: the exception raised by func, or by the commit
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Write queue is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="paralympics-writer",
+                                                daemon=True)
+                self._thread.start()
+            self._queue.put((func, future))
+        return future.result(timeout=self.timeout)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        while batch[-1] is not _STOP and len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        try:
+            # isolation_level=None: transactions are started and ended by the statements below
+            conn = self.connect()
+            conn.isolation_level = None
+        except Exception as e:
+            self._fail_all(e)
+            return
+        try:
+            stopping = False
+            while not stopping:
+                batch = self._next_batch()
+                if batch[-1] is _STOP:
+                    batch.pop()
+                    stopping = True
+                if batch:
+                    self._commit_batch(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch):
+        done = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for func, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            conn.execute("SAVEPOINT write")
+            try:
+                result = func(conn)
+            except BaseException as e:
+                conn.execute("ROLLBACK TO write")
+                conn.execute("RELEASE write")
+                future.set_exception(e)
+                continue
+            conn.execute("RELEASE write")
+            done.append((future, result))
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            for future, _ in done:
+                future.set_exception(e)
+            return
+        self.commits += 1
+        if self.on_commit is not None:
+            try:
+                self.on_commit()
+            except Exception:
+                pass  # the writes are committed whatever happens to the copy
+        for future, result in done:
+            future.set_result(result)
+
+    def _fail_all(self, error: Exception):
+        # The writer could not start: fail everything queued, and anything submitted later
+        with self._lock:
+            self._closed = True
+            self._thread = None
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                item[1].set_exception(error)
@@ -1,6 +1,12 @@
-from flask import Flask
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 
+from flask import Flask, request, url_for
+
+from paralympics.api_client import ApiClient
+from paralympics.cache import DatasetCache, FigureCache, QuizCache
 from paralympics.config import DevConfig
+from paralympics.news import NewsFeed
 
 def create_app(config_class=DevConfig):
     """Create and configure the Flask application.
@@ -21,8 +27,73 @@ def create_app(config_class=DevConfig):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    # Create one API client so that requests to the REST API share pooled connections
+    app.extensions["api_client"] = ApiClient.from_config(app.config)
+    # Share the chart data between requests
+    app.extensions["dataset_cache"] = DatasetCache(app.extensions["api_client"],
+                                                   ttl=app.config["DATASET_CACHE_TTL"])
+    app.extensions["figure_cache"] = FigureCache(app.config["FIGURE_CACHE_MAX_BYTES"])
+    # Keep the quiz questions so that answering a question needs no API request
+    app.extensions["quiz_cache"] = QuizCache(app.extensions["api_client"],
+                                             ttl=app.config["QUIZ_CACHE_TTL"])
+    # Serve the last good news stories and refresh them in the background
+    app.extensions["news_feed"] = NewsFeed(app.config["NEWS_URL"],
+                                           timeout=app.config["NEWS_TIMEOUT"],
+                                           interval=app.config["NEWS_REFRESH_INTERVAL"],
+                                           max_bytes=app.config["NEWS_MAX_BYTES"],
+                                           max_stories=app.config["NEWS_MAX_STORIES"])
+    # Shared pool for routes that make independent calls at the same time, see concurrency.fan_out
+    app.extensions["executor"] = ThreadPoolExecutor(max_workers=app.config["FAN_OUT_MAX_WORKERS"],
+                                                    thread_name_prefix="paralympics-fan-out")
+    # Stop its threads when the app is garbage collected, or at the latest when Python exits
+    weakref.finalize(app, app.extensions["executor"].shutdown, wait=False)
+
+    # Serve plotly.js once as a long-cached static file rather than inline in every figure
+    if app.config["PLOTLYJS_MODE"] == "static":
+        _configure_static_plotlyjs(app)
+    # Charts are drawn in the browser with the static plotly.js
+    if app.config["CHART_RENDERING"] == "client" and app.config["PLOTLYJS_MODE"] != "static":
+        app.config["CHART_RENDERING"] = "server"
+
     # Register the blueprint
     from paralympics.main import bp
     app.register_blueprint(bp)
 
+    # Build the charts in the background so the first visitors do not wait for them
+    if app.config["CHART_WARMUP"]:
+        from paralympics.warmup import ChartWarmer
+
+        warmer = ChartWarmer(app, workers=app.config["CHART_WARMUP_WORKERS"],
+                             interval=app.config["CHART_WARMUP_INTERVAL"])
+        app.extensions["chart_warmer"] = warmer
+        warmer.start()
+
     return app
+
+
+def _configure_static_plotlyjs(app):
+    """Write the versioned plotly.js to the static folder and serve it with a long cache lifetime.
+
+    Falls back to inline plotly.js if the static folder cannot be written to.
+    """
+    from paralympics.charts import plotlyjs_filename, write_plotlyjs
+
+    try:
+        write_plotlyjs(app.static_folder)
+    except OSError as e:
+        app.logger.warning("Could not write plotly.js to the static folder, using inline: %s", e)
+        app.config["PLOTLYJS_MODE"] = "inline"
+        return
+
+    filename = plotlyjs_filename()
+
+    @app.context_processor
+    def inject_plotlyjs_url():
+        return {"plotlyjs_url": url_for("static", filename=filename)}
+
+    @app.after_request
+    def cache_plotlyjs(response):
+        if request.endpoint == "static" and request.view_args.get("filename") == filename:
+            response.headers["Cache-Control"] = \
+                f"public, max-age={app.config['PLOTLYJS_MAX_AGE']}, immutable"
+        return response
@@ -0,0 +1,138 @@
+""" Client for the mock paralympics REST API.
+
+A single client is created by the application factory and stored in ``app.extensions`` so that all
+requests to the API share one :class:`requests.Session`, and therefore reuse pooled keep-alive
+connections rather than opening a new TCP connection for every call.
+"""
+import threading
+from collections import OrderedDict
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+
+class ApiClient:
+    """ HTTP client for the REST API using a pooled keep-alive session.
+
+    Attributes:
+        base_url: URL of the REST API, e.g. http://127.0.0.1:8000
+        timeout: default timeout in seconds for each request
+        session: requests Session shared by all calls
+
+    Methods:
+        url(self, path): Returns the full URL for an API path
+        get(self, path, **kwargs): Sends a GET request
+        post(self, path, **kwargs): Sends a POST request
+        get_json(self, path, **kwargs): Sends a GET request and returns the decoded JSON
+        get_validated(self, path, decode, **kwargs): Sends a GET request that revalidates the
+            previous response and returns the decoded value
+        iter_rows(self, path, page_size=500, **kwargs): Yields the rows of a table route page by
+            page, following the rel="next" links
+        close(self): Closes the pooled connections
+    """
+
+    # Maximum number of responses kept for revalidation
+    MAX_VALIDATED = 256
+
+    def __init__(self, base_url, timeout=2, pool_connections=1, pool_maxsize=10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._validated = OrderedDict()
+        self._validated_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def from_config(cls, config):
+        """ Creates a client from the ``API_*`` settings of a Flask config """
+        return cls(config["API_BASE_URL"],
+                   timeout=config["API_TIMEOUT"],
+                   pool_connections=config["API_POOL_CONNECTIONS"],
+                   pool_maxsize=config["API_POOL_MAXSIZE"])
+
+    def url(self, path):
+        """ Returns the full URL for a path such as '/all'. Full URLs are returned unchanged. """
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(self.url(path), **kwargs)
+
+    def post(self, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(self.url(path), **kwargs)
+
+    def get_json(self, path, **kwargs):
+        resp = self.get(path, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
+    def get_validated(self, path, decode, **kwargs):
+        """ Sends a GET request, revalidating the last response for the same URL
+
+        The ETag and Last-Modified of the last response for the same URL and Accept header are
+        sent as If-None-Match / If-Modified-Since. If the API replies 304 Not Modified the value
+        decoded from the last response is returned without downloading or decoding it again.
+
+        Args:
+            path: path or URL of the API route
+            decode: function that takes the Response and returns the value to cache
+            **kwargs: passed to get(), e.g. params or headers
+
+        Returns:
+            value: the decoded response
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        url = requests.Request("GET", self.url(path), params=kwargs.get("params")).prepare().url
+        key = (url, headers.get("Accept"))
+        with self._validated_lock:
+            cached = self._validated.get(key)
+        if cached:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        resp = self.get(path, headers=headers, **kwargs)
+        if resp.status_code == 304 and cached:
+            return cached[2]
+        resp.raise_for_status()
+        value = decode(resp)
+        etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+        if etag or last_modified:
+            with self._validated_lock:
+                self._validated[key] = (etag, last_modified, value)
+                self._validated.move_to_end(key)
+                while len(self._validated) > self.MAX_VALIDATED:
+                    self._validated.popitem(last=False)
+        return value
+
+    def iter_rows(self, path, page_size=500, **kwargs):
+        """ Yields every row of a table or search route, requesting one page at a time
+
+        Only one page of rows is held in memory. The API's Link rel="next" header is followed until
+        there are no more pages.
+        """
+        params = dict(kwargs.pop("params", None) or {})
+        params["limit"] = page_size
+        resp = self.get(path, params=params, **kwargs)
+        while True:
+            resp.raise_for_status()
+            yield from resp.json()
+            next_page = resp.links.get("next")
+            if not next_page:
+                return
+            resp = self.get(next_page["url"], **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def get_api_client():
+    """ Returns the API client of the current Flask app """
+    return current_app.extensions["api_client"]
@@ -0,0 +1,322 @@
+""" In-process caches used by the Flask app.
+
+The caches are created by the application factory and stored in ``app.extensions``.
+"""
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:  # optional dependency, the json module is used instead
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency, CSV is used instead of Arrow
+    pa = None
+
+COMPACT_JSON = "application/vnd.paralympics.compact+json"
+
+# Accept header asking the REST API for a columnar format that loads into pandas with little
+# parsing. Compact JSON is offered for APIs without CSV; plain JSON is the last resort.
+if pa is not None:
+    COLUMNAR_ACCEPT = (f"application/vnd.apache.arrow.stream, text/csv;q=0.9, {COMPACT_JSON};q=0.8, "
+                       "application/json;q=0.5")
+else:
+    COLUMNAR_ACCEPT = f"text/csv, {COMPACT_JSON};q=0.8, application/json;q=0.5"
+
+
+# Columns of the REST API data that are converted to numbers when a dataset is loaded
+NUMERIC_COLUMNS = ["latitude", "longitude", "events", "sports", "countries", "participants_m",
+                   "participants_f", "participants"]
+
+
+def to_typed_frame(data):
+    """ Creates a DataFrame from REST API records with numeric columns converted up front.
+
+    latitude and longitude become floats (invalid values become NaN), year becomes an integer, and
+    the participant and count columns become numbers.
+
+    Args:
+        data: list of dicts, one per row, or a DataFrame
+
+    Returns:
+        df: DataFrame with the data
+    """
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    if "year" in df.columns:
+        df["year"] = pd.to_numeric(df["year"], errors="coerce").astype("Int64")
+    return df
+
+
+def read_frame(content, content_type):
+    """ Loads a REST API response body into a typed DataFrame according to its content type
+
+    Arrow IPC streams and CSV are read directly by pyarrow and pandas. JSON is decoded first; the
+    compact shape ({"columns": [...], "rows": [[...], ...]}) becomes a DataFrame without a dict
+    per row.
+
+    Args:
+        content: response body bytes
+        content_type: Content-Type of the response
+
+    Returns:
+        df: DataFrame with the data, see to_typed_frame
+    """
+    media_type = (content_type or "").split(";")[0].strip()
+    if media_type == "application/vnd.apache.arrow.stream":
+        df = pa.ipc.open_stream(content).read_pandas()
+    elif media_type == "text/csv":
+        df = pd.read_csv(io.BytesIO(content))
+    elif media_type == COMPACT_JSON:
+        body = loads(content)
+        df = pd.DataFrame(body["rows"], columns=body["columns"])
+    else:
+        df = pd.DataFrame(loads(content))
+    return to_typed_frame(df)
+
+
+def loads(content):
+    """ Decodes JSON bytes, with orjson if it is installed """
+    return orjson.loads(content) if orjson is not None else json.loads(content)
+
+
+def frame_from_response(resp):
+    """ Loads a requests Response into a typed DataFrame, see read_frame """
+    return read_frame(resp.content, resp.headers.get("Content-Type"))
+
+
+class _Dataset:
+    """ A cached DataFrame and the validators needed to revalidate it """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frame = None
+        self.version = None
+        self.etag = None
+        self.last_modified = None
+        self.fetched_at = 0.0
+
+
+class DatasetCache:
+    """ Cache of DataFrames loaded from REST API routes such as /all.
+
+    Data is requested in a columnar format (Arrow if pyarrow is installed, else CSV) so it loads
+    into pandas without building a Python dict per row. A dataset is reused for ``ttl`` seconds.
+    After that the API is asked again with a conditional request (If-None-Match /
+    If-Modified-Since) using the validators from the last response. If the data has not changed
+    the cached DataFrame is kept without downloading or parsing it again.
+
+    The DataFrames are shared between requests so callers must not modify them in place.
+
+    Attributes:
+        api: ApiClient used to fetch the data
+        ttl: seconds a dataset is used before it is revalidated
+
+    Methods:
+        get(self, path): Returns the DataFrame for an API path
+        version(self, path): Returns a token that changes whenever the data for the path changes
+        clear(self): Empties the cache
+    """
+
+    def __init__(self, api, ttl=60):
+        self.api = api
+        self.ttl = ttl
+        self._datasets = {}
+        self._lock = threading.Lock()
+
+    def _dataset(self, path):
+        with self._lock:
+            return self._datasets.setdefault(path, _Dataset())
+
+    def _refresh(self, path):
+        """ Returns the dataset for the path, revalidating it if the ttl has expired """
+        ds = self._dataset(path)
+        with ds.lock:
+            if ds.frame is not None and time.monotonic() - ds.fetched_at < self.ttl:
+                return ds
+            headers = {"Accept": COLUMNAR_ACCEPT}
+            if ds.frame is not None:
+                if ds.etag:
+                    headers["If-None-Match"] = ds.etag
+                if ds.last_modified:
+                    headers["If-Modified-Since"] = ds.last_modified
+            resp = self.api.get(path, headers=headers)
+            if resp.status_code == 304 and ds.frame is not None:
+                ds.fetched_at = time.monotonic()
+                return ds
+            resp.raise_for_status()
+            version = resp.headers.get("ETag") or hashlib.sha1(resp.content).hexdigest()
+            if version != ds.version or ds.frame is None:
+                ds.frame = frame_from_response(resp)
+                ds.version = version
+            ds.etag = resp.headers.get("ETag")
+            ds.last_modified = resp.headers.get("Last-Modified")
+            ds.fetched_at = time.monotonic()
+            return ds
+
+    def get(self, path):
+        return self._refresh(path).frame
+
+    def version(self, path):
+        return self._refresh(path).version
+
+    def clear(self):
+        with self._lock:
+            self._datasets.clear()
+
+
+class FigureCache:
+    """ Least recently used cache of rendered figures, limited by total size in bytes.
+
+    Keys should include everything the figure depends on: the chart type, its parameters and a
+    data version token, so that a change in the data produces a new key rather than a stale hit.
+
+    Attributes:
+        max_bytes: maximum total size of the cached values; least recently used values are evicted
+        size_bytes: current total size of the cached values
+
+    Methods:
+        get(self, key): Returns the cached value or None
+        set(self, key, value): Stores a value, evicting old values to stay within max_bytes
+        get_or_create(self, key, create): Returns the cached value, calling create() on a miss
+        clear(self): Empties the cache
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value):
+        size = len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size_bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._items[key] = (value, size)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.size_bytes -= evicted_size
+
+    def get_or_create(self, key, create):
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size_bytes = 0
+
+
+class QuizCache:
+    """ Cache of the quiz questions and responses from the REST API /quiz route.
+
+    The whole quiz is small and only changes when a question is added, so it is fetched in one
+    request and kept as a question count, a dict of questions by id and a dict of responses by
+    question id. Showing or answering a question then needs no request to the API. After ``ttl``
+    seconds the quiz is revalidated with If-None-Match, so questions added by other clients are
+    picked up; a 304 keeps the cached quiz. :meth:`invalidate` makes the next call fetch the quiz
+    again, and is called after this app adds a question.
+
+    Attributes:
+        api: ApiClient used to fetch the quiz
+        ttl: seconds the quiz is used before it is revalidated
+
+    Methods:
+        get(self, qid): Returns the question count, a question and its responses
+        version(self): Returns the ETag of the cached quiz
+        invalidate(self): Makes the next call fetch the quiz again
+    """
+
+    def __init__(self, api, ttl=60):
+        self.api = api
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._content = None
+        self._etag = None
+        self._fetched_at = 0.0
+
+    def _refresh(self):
+        """ Returns (question_count, questions, responses), revalidating them if the ttl has expired """
+        with self._lock:
+            if self._content is not None and time.monotonic() - self._fetched_at < self.ttl:
+                return self._content
+            headers = {}
+            if self._content is not None and self._etag:
+                headers["If-None-Match"] = self._etag
+            resp = self.api.get("/quiz", headers=headers)
+            if resp.status_code != 304 or self._content is None:
+                resp.raise_for_status()
+                quiz = loads(resp.content)
+                questions = {q["id"]: q for q in quiz["questions"]}
+                responses = {q["id"]: q.pop("responses") for q in quiz["questions"]}
+                self._content = (quiz["question_count"], questions, responses)
+                self._etag = resp.headers.get("ETag")
+            self._fetched_at = time.monotonic()
+            return self._content
+
+    def get(self, qid):
+        """ Returns the quiz data for a question, in the same shape as the /quiz/{id} route
+
+        The values are shared between requests, so they must not be modified.
+
+        Returns:
+            quiz: dict with question_count, question (None if there is no question with the id)
+            and its list of responses
+        """
+        count, questions, responses = self._refresh()
+        return {"question_count": count, "question": questions.get(qid),
+                "responses": responses.get(qid, [])}
+
+    def version(self):
+        self._refresh()
+        return self._etag
+
+    def invalidate(self):
+        with self._lock:
+            self._content = None
+            self._etag = None
+
+
+def get_dataset_cache():
+    """ Returns the dataset cache of the current Flask app """
+    return current_app.extensions["dataset_cache"]
+
+
+def get_figure_cache():
+    """ Returns the figure cache of the current Flask app """
+    return current_app.extensions["figure_cache"]
+
+
+def get_quiz_cache():
+    """ Returns the quiz cache of the current Flask app """
+    return current_app.extensions["quiz_cache"]
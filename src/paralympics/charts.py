@@ -1,22 +1,97 @@
+import json
+from pathlib import Path
+from urllib.parse import urlencode
+
 import pandas as pd
 import plotly.express as px
-import requests
+import plotly.offline
+from flask import current_app, url_for
+from markupsafe import Markup
+
+from paralympics.api_client import get_api_client
+from paralympics.cache import COLUMNAR_ACCEPT, COMPACT_JSON, frame_from_response, \
+    get_dataset_cache, get_figure_cache, to_typed_frame
+
+
+# Values accepted by line_chart and bar_chart
+LINE_FEATURES = ["sports", "participants", "events", "countries"]
+EVENT_TYPES = ["summer", "winter"]
+
+
+def get_api_data(url, stream=False, chunk_rows=1000, compact=False):
+    """ Gets the data from the mock_api REST API
 
+    The data is requested in a columnar format (Arrow IPC if pyarrow is installed, else CSV) that
+    loads into a DataFrame without building a dict per row. Revalidates the last response for the
+    same URL with If-None-Match, so unchanged data is not downloaded or parsed again.
 
-def get_api_data(url):
-    """ Gets the JSON data from the mock_api REST API
+    With compact=True the data is requested as compact JSON, the column names followed by each row
+    as an array. Responses in the compact shape are also recognised by their Content-Type when
+    the URL asks for them, e.g. /games?format=compact.
+
+    With stream=True the data is requested as newline delimited JSON and read a chunk of rows at
+    a time, so the whole response is never held as one list of dicts.
 
     Args:
-        url: URL for the REST API route, e.g. http://127.0.0.1:8000/all
+        url: path or URL for the REST API route, e.g. /all
+        stream: read the response as an NDJSON stream
+        chunk_rows: number of rows parsed into each DataFrame chunk when streaming
+        compact: request the compact JSON shape
 
     Returns:
         df: DataFrame with the data
     """
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    df = pd.DataFrame(data)
-    return df
+    if stream:
+        return _read_ndjson(url, chunk_rows)
+    accept = COMPACT_JSON if compact else COLUMNAR_ACCEPT
+    df = get_api_client().get_validated(url, frame_from_response, headers={"Accept": accept})
+    # The cached frame is shared, so return a copy the caller can add columns to
+    return df.copy(deep=False)
+
+
+def _read_ndjson(url, chunk_rows):
+    """ Reads an NDJSON response into a DataFrame in chunks of chunk_rows rows """
+    resp = get_api_client().get(url, headers={"Accept": "application/x-ndjson"}, stream=True)
+    with resp:
+        resp.raise_for_status()
+        chunks = []
+        records = []
+        for line in resp.iter_lines():
+            if line:
+                records.append(json.loads(line))
+            if len(records) >= chunk_rows:
+                chunks.append(pd.DataFrame.from_records(records))
+                records = []
+    if records or not chunks:
+        chunks.append(pd.DataFrame.from_records(records))
+    return to_typed_frame(pd.concat(chunks, ignore_index=True))
+
+
+def get_all_data():
+    """ Gets the /all data for the charts from the app's shared dataset cache
+
+    The DataFrame is shared between requests so it must not be modified in place.
+
+    Returns:
+        df: DataFrame with numeric latitude, longitude and participant columns and an integer year
+    """
+    return get_dataset_cache().get("/all")
+
+
+def line_chart_path(feature):
+    """ Returns the REST API path for the yearly totals of a feature plotted by line_chart
+
+    The games are summed by the API for each event type and year. This uses the games table
+    rather than /all, where games with more than one host appear once per host.
+
+    Raises:
+        ValueError: if feature is not one of events, sports, countries, participants
+    """
+    if feature not in LINE_FEATURES:
+        raise ValueError(
+            'Invalid value for "feature". Must be one of ["sports", "participants", "events", "countries"]')
+    query = urlencode({"group_by": "event_type,year", "metrics": f"sum({feature})"})
+    return f"/games/aggregate?{query}"
 
 
 def line_chart(feature):
@@ -31,16 +106,8 @@ def line_chart(feature):
      Returns:
         fig: Plotly Express line figure
      """
-
-    if feature not in ["sports", "participants", "events", "countries"]:
-        raise ValueError(
-            'Invalid value for "feature". Must be one of ["sports", "participants", "events", "countries"]')
-    else:
-        feature = feature.lower()
-
-    df = get_api_data("http://127.0.0.1:8000/all")
-
-    chart_df = df[["event_type", "year", feature]]
+    path = line_chart_path(feature)
+    chart_df = get_dataset_cache().get(path).rename(columns={f"sum_{feature}": feature})
 
     fig = px.line(chart_df,
                   x="year",
@@ -58,14 +125,10 @@ def scatter_map():
         fig: Plotly Express scatter map figure
     """
 
-    df = get_api_data("http://127.0.0.1:8000/all")
+    df = get_all_data()
 
     chart_df = df[["year", "place_name", "latitude", "longitude"]].copy()
 
-    # Ensure latitude/longitude are numeric (non-numeric -> NaN)
-    chart_df['longitude'] = pd.to_numeric(chart_df['longitude'], errors='coerce')
-    chart_df['latitude'] = pd.to_numeric(chart_df['latitude'], errors='coerce')
-
     # Add a new column that concatenates the place_name and year e.g. Barcelona 2012
     chart_df['name'] = chart_df['place_name'] + ' ' + chart_df['year'].astype(str)
 
@@ -82,6 +145,26 @@ def scatter_map():
     return fig
 
 
+def bar_chart_path(event_type):
+    """ Returns the REST API path for the participant ratios plotted by bar_chart
+
+    The API filters the games to one event type and calculates the male and female share of the
+    participants at each host, so only one row per bar is downloaded.
+
+    Raises:
+        ValueError: if event_type is not summer or winter
+    """
+    if event_type not in EVENT_TYPES:
+        raise ValueError('Invalid value for "event_type". Must be one of ["summer", "winter"]')
+    query = urlencode({
+        "event_type": event_type,
+        "participants__gt": 0,
+        "group_by": "year,place_name",
+        "metrics": "ratio(participants_m,participants),ratio(participants_f,participants)",
+    })
+    return f"/all/aggregate?{query}"
+
+
 def bar_chart(event_type):
     """
     Creates a stacked bar chart showing change in the ration of male and female competitors in the summer and winter paralympics.
@@ -92,21 +175,12 @@ def bar_chart(event_type):
     Returns
     fig: Plotly Express bar chart
     """
-    df = get_api_data("http://127.0.0.1:8000/all")
-    needed = ['event_type', 'year', 'place_name', 'participants_m', 'participants_f',
-              'participants']
+    df = get_dataset_cache().get(bar_chart_path(event_type))
     df_plot = (
-        df[needed]
-        .dropna(subset=['participants_m', 'participants_f'])
-        .query("event_type == @event_type")
-        .assign(  # Avoid divide-by-zero; if participants==0, set NaN, then drop
-            Male=lambda d: d['participants_m'].where(d['participants'] != 0, pd.NA) / d[
-                'participants'],
-            Female=lambda d: d['participants_f'].where(d['participants'] != 0, pd.NA) / d[
-                'participants'],
-            xlabel=lambda d: d['place_name'] + " " + d['year'].astype(str), )
+        df.rename(columns={"ratio_participants_m_participants": "Male",
+                           "ratio_participants_f_participants": "Female"})
         .dropna(subset=['Male', 'Female'])
-        .sort_values(['event_type', 'year'])
+        .assign(xlabel=lambda d: d['place_name'] + " " + d['year'].astype(str))
     )
 
     fig = px.bar(df_plot,
@@ -119,3 +193,127 @@ def bar_chart(event_type):
     fig.update_xaxes(ticklen=0)
     fig.update_yaxes(tickformat=".0%")
     return fig
+
+
+# Chart functions by the name used in figure cache keys
+CHARTS = {"line": line_chart, "bar": bar_chart, "map": scatter_map}
+
+# Functions returning the REST API path each chart gets its data from, given the chart's arguments
+CHART_DATA = {"line": line_chart_path, "bar": bar_chart_path, "map": lambda: "/all"}
+
+# Every chart and parameters the app can display
+CHART_VARIANTS = [("line", f) for f in LINE_FEATURES] + [("bar", e) for e in EVENT_TYPES] + [("map",)]
+
+
+def plotlyjs_filename():
+    """ Returns the versioned path of plotly.js within the static folder, e.g. js/plotly-3.0.1.min.js """
+    return f"js/plotly-{plotly.offline.get_plotlyjs_version()}.min.js"
+
+
+def write_plotlyjs(static_folder):
+    """ Writes the plotly.js bundle from the installed plotly package to the static folder
+
+    The file name includes the plotly.js version so it can be served with a long cache lifetime.
+    Nothing is written if the file already exists.
+
+    Args:
+        static_folder: path to the Flask app static folder
+
+    Returns:
+        path: path to the plotly.js file
+    """
+    path = Path(static_folder).joinpath(plotlyjs_filename())
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(plotly.offline.get_plotlyjs(), encoding="utf-8")
+        tmp.replace(path)
+    return path
+
+
+def _figure_key(chart, params, output):
+    """ Returns the figure cache key for a chart, including the version of the chart's data
+
+    Raises:
+        KeyError: if the chart name is unknown
+        TypeError, ValueError: if the parameters are not valid for the chart
+    """
+    data_version = get_dataset_cache().version(CHART_DATA[chart](*params))
+    return chart, params, output, data_version
+
+
+def chart_html(chart, *params):
+    """ Returns the HTML for a chart, using the app's figure cache
+
+    The cache key includes the version of the chart's data (see CHART_DATA), so a cached figure is
+    only reused while the data it was built from is unchanged. A cache hit does not use pandas or Plotly.
+
+    When PLOTLYJS_MODE is "static" the page loads plotly.js from the static folder, so the HTML
+    only contains the figure's JSON spec. Otherwise plotly.js is included inline with each figure.
+
+    Args:
+        chart (str): name of the chart in CHARTS, e.g. "line"
+        *params: arguments for the chart function, e.g. "sports"
+
+    Returns:
+        html: HTML div containing the figure
+    """
+    include_plotlyjs = current_app.config["PLOTLYJS_MODE"] != "static"
+    key = _figure_key(chart, params, include_plotlyjs)
+    return get_figure_cache().get_or_create(
+        key,
+        lambda: CHARTS[chart](*params).to_html(full_html=False, include_plotlyjs=include_plotlyjs))
+
+
+def chart_json(chart, *params):
+    """ Returns the Plotly figure spec for a chart as JSON, using the app's figure cache
+
+    Args:
+        chart (str): name of the chart in CHARTS, e.g. "line"
+        *params: arguments for the chart function, e.g. "sports"
+
+    Returns:
+        json: figure JSON with data and layout, for Plotly.newPlot in the browser
+
+    Raises:
+        KeyError: if the chart name is unknown
+        TypeError, ValueError: if the parameters are not valid for the chart
+    """
+    key = _figure_key(chart, params, "json")
+    return get_figure_cache().get_or_create(key, lambda: CHARTS[chart](*params).to_json())
+
+
+def chart_placeholder(chart, *params):
+    """ Returns an empty chart container that static/js/charts.js fills with the figure JSON
+
+    Args:
+        chart (str): name of the chart in CHARTS, e.g. "line"
+        *params: arguments for the chart function, at most one, e.g. "sports"
+
+    Returns:
+        html: HTML div with the URL of the figure JSON
+    """
+    url = url_for("main.chart_figure", chart=chart, param=params[0]) if params \
+        else url_for("main.chart_figure", chart=chart)
+    return Markup('<div class="chart-placeholder" data-figure-url="{}">'
+                  '<p class="text-muted">Loading chart...</p></div>').format(url)
+
+
+def render_chart(chart, *params):
+    """ Returns the chart in the form used by the pages: figure JSON for client rendering,
+    otherwise figure HTML. Either way the result is stored in the figure cache. """
+    if current_app.config["CHART_RENDERING"] == "client":
+        return chart_json(chart, *params)
+    return chart_html(chart, *params)
+
+
+def chart_markup(chart, *params):
+    """ Returns the HTML to put in a page for a chart
+
+    When CHART_RENDERING is "client" the page gets a placeholder and the browser fetches the
+    figure JSON after the page has loaded, so the page is not held up while the chart is built.
+    Otherwise the figure HTML is built before the page is returned, see chart_html.
+    """
+    if current_app.config["CHART_RENDERING"] == "client":
+        return chart_placeholder(chart, *params)
+    return chart_html(chart, *params)
@@ -0,0 +1,58 @@
+""" Runs independent pieces of work for a request at the same time.
+
+The app has one bounded thread pool, created by the application factory and stored in
+``app.extensions``. fan_out runs callables in it and waits for all of them, so a page that needs
+several API calls or charts takes as long as the slowest one rather than the sum of them all.
+"""
+import contextvars
+import threading
+from concurrent.futures import FIRST_EXCEPTION, wait
+
+from flask import current_app
+
+_worker = threading.local()
+
+
+def _run_in_worker(ctx, func):
+    # Flask keeps the app and request contexts in context variables, so running in a copy of the
+    # caller's context gives the call the same current_app, g and request
+    _worker.active = True
+    try:
+        return ctx.run(func)
+    finally:
+        _worker.active = False
+
+
+def fan_out(*calls, timeout=None):
+    """ Calls each function at the same time in the app's thread pool and returns their results
+
+    Each call runs in a copy of the caller's context, so it can use current_app and the other
+    Flask context globals. Calls made from inside a fan_out call run one after another in the
+    current thread, so a full pool cannot wait on itself.
+
+    Args:
+        *calls: functions that take no arguments, e.g. functools.partial(chart_markup, "bar", t)
+        timeout: seconds to wait for all the calls, defaults to the FAN_OUT_TIMEOUT config value
+
+    Returns:
+        results: list of the return values, in the same order as calls
+
+    Raises:
+        TimeoutError: if the calls have not all finished within the timeout
+        Exception: the exception raised by a call that failed; calls not yet started are cancelled
+    """
+    if len(calls) <= 1 or getattr(_worker, "active", False):
+        return [call() for call in calls]
+    if timeout is None:
+        timeout = current_app.config["FAN_OUT_TIMEOUT"]
+    executor = current_app.extensions["executor"]
+    futures = [executor.submit(_run_in_worker, contextvars.copy_context(), call) for call in calls]
+    done, pending = wait(futures, timeout=timeout, return_when=FIRST_EXCEPTION)
+    for future in pending:
+        future.cancel()
+    for future in futures:
+        if future in done and future.exception() is not None:
+            raise future.exception()
+    if pending:
+        raise TimeoutError(f"{len(pending)} of {len(calls)} calls did not finish in {timeout}s")
+    return [future.result() for future in futures]
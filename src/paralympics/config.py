@@ -13,11 +13,68 @@ class Config:
         TESTING (bool): Toggle testing mode. Defaults to ``False``.
         CSRF_ENABLED (bool): Enable CSRF protection. Defaults to ``True``.
         SECRET_KEY (str): Secret key for sessions and CSRF. Defaults to ``'dev'``.
+        API_BASE_URL (str): URL of the REST API. Defaults to ``'http://127.0.0.1:8000'``.
+        API_TIMEOUT (float): Timeout in seconds for requests to the REST API. Defaults to ``2``.
+        API_POOL_CONNECTIONS (int): Number of host connection pools to keep. Defaults to ``1``.
+        API_POOL_MAXSIZE (int): Maximum keep-alive connections per host. Defaults to ``10``.
+        DATASET_CACHE_TTL (float): Seconds chart data from the REST API is reused before it is
+            revalidated. Defaults to ``60``.
+        QUIZ_CACHE_TTL (float): Seconds the quiz questions are used before they are revalidated
+            with the REST API. Defaults to ``60``.
+        FIGURE_CACHE_MAX_BYTES (int): Maximum total size of the rendered chart cache. Defaults
+            to 64 MiB.
+        PLOTLYJS_MODE (str): ``'static'`` loads one versioned plotly.js file from the static folder
+            in every page; ``'inline'`` embeds plotly.js in each figure. Defaults to ``'static'``.
+        PLOTLYJS_MAX_AGE (int): Cache lifetime in seconds of the static plotly.js file. Defaults to
+            one year.
+        CHART_RENDERING (str): ``'client'`` returns pages straight away with chart placeholders,
+            which the browser fills by fetching the figure JSON from ``/charts/...``; ``'server'``
+            builds the chart HTML before returning the page. Client rendering needs
+            ``PLOTLYJS_MODE = 'static'``, otherwise server rendering is used. Defaults to
+            ``'client'``.
+        CHART_WARMUP (bool): Build every chart in the background when the app starts, and again
+            whenever the data changes. ``/ready`` returns 503 until the first build finishes.
+            Defaults to ``False``.
+        CHART_WARMUP_WORKERS (int): Number of charts built at the same time during warm-up.
+            Defaults to ``2``.
+        CHART_WARMUP_INTERVAL (float): Seconds between checks for changed data after warm-up.
+            Defaults to ``60``.
+        FAN_OUT_MAX_WORKERS (int): Size of the thread pool that routes use to make independent
+            API calls and build server-rendered charts at the same time. Defaults to ``4``.
+        FAN_OUT_TIMEOUT (float): Seconds a route waits for the calls it runs at the same time.
+            Defaults to ``10``.
+        NEWS_URL (str): Search API the /news page gets its stories from. Defaults to the Hacker
+            News search for paralympics stories.
+        NEWS_TIMEOUT (float): Seconds to wait for the news API before giving up. Defaults to ``3``.
+        NEWS_REFRESH_INTERVAL (float): Seconds the news stories are served before they are
+            refreshed in the background. Defaults to ``300``.
+        NEWS_MAX_BYTES (int): Largest news API response that is read. Defaults to 1 MiB.
+        NEWS_MAX_STORIES (int): Number of stories shown on the /news page. Defaults to ``20``.
     """
     DEBUG = False
     TESTING = False
     CSRF_ENABLED = True
     SECRET_KEY = 'dev'
+    API_BASE_URL = 'http://127.0.0.1:8000'
+    API_TIMEOUT = 2
+    API_POOL_CONNECTIONS = 1
+    API_POOL_MAXSIZE = 10
+    DATASET_CACHE_TTL = 60
+    QUIZ_CACHE_TTL = 60
+    FIGURE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    PLOTLYJS_MODE = 'static'
+    PLOTLYJS_MAX_AGE = 365 * 24 * 60 * 60
+    CHART_RENDERING = 'client'
+    CHART_WARMUP = False
+    CHART_WARMUP_WORKERS = 2
+    CHART_WARMUP_INTERVAL = 60
+    FAN_OUT_MAX_WORKERS = 4
+    FAN_OUT_TIMEOUT = 10
+    NEWS_URL = 'https://hn.algolia.com/api/v1/search?query=paralympics&tags=story'
+    NEWS_TIMEOUT = 3
+    NEWS_REFRESH_INTERVAL = 300
+    NEWS_MAX_BYTES = 1024 * 1024
+    NEWS_MAX_STORIES = 20
 
 
 class ProductionConfig(Config):
@@ -1,36 +1,22 @@
+from functools import partial
+
 import requests
-from flask import Blueprint, flash, redirect, render_template, url_for
+from flask import Blueprint, abort, current_app, flash, redirect, render_template, request, url_for
 
-from paralympics.charts import bar_chart, line_chart, scatter_map
+from paralympics.api_client import get_api_client
+from paralympics.cache import get_quiz_cache
+from paralympics.charts import CHART_VARIANTS, chart_json, chart_markup
+from paralympics.concurrency import fan_out
 from paralympics.forms import NewQuestionForm, ParalympicsTypeForm, QuizForm, TrendSelectForm
-
-API_BASE_URL = "http://127.0.0.1:8000"
+from paralympics.news import get_news_feed
+from paralympics.warmup import get_chart_warmer
 
 bp = Blueprint('main', __name__)
 
 
-def _get_number_questions():
-    """ Helper to get the number of questions available"""
-    q_resp = requests.get(f"{API_BASE_URL}/question", timeout=2)
-    q_resp.raise_for_status()
-    questions = q_resp.json()
-    return len(questions)
-
-
-def _get_question(qid):
-    """ Helper to get the question"""
-    q_resp = requests.get(f"{API_BASE_URL}/question/{qid}", timeout=2)
-    q_resp.raise_for_status()
-    q = q_resp.json()
-    return q
-
-
-def _get_responses(qid):
-    """ Helper to get the questions and responses for a given question id"""
-    r_resp = requests.get(f"{API_BASE_URL}/response/search?question_id={qid}", timeout=2)
-    r_resp.raise_for_status()
-    r = r_resp.json()
-    return r
+def _get_quiz(qid):
+    """ Helper to get a question, its responses and the number of questions from the quiz cache"""
+    return get_quiz_cache().get(qid)
 
 
 @bp.route("/", methods=["GET", "POST"])
@@ -49,16 +35,17 @@ def index(qid=1):
     # Create an instance of the form
     form = QuizForm()
 
-    # Logic to handle which question the user is on
-    number_questions = _get_number_questions()
+    # Get the question, its responses and the number of questions, from the cache if possible
+    quiz = _get_quiz(qid)
+    number_questions = quiz["question_count"]
 
-    if qid < 1 or qid > number_questions:
+    # Logic to handle which question the user is on
+    if qid < 1 or qid > number_questions or quiz["question"] is None:
         flash("Oops, that question does not exist!")
         return redirect(url_for("main.index"))
 
-    # Get the question and responses for the current question
-    question = _get_question(qid)
-    responses = _get_responses(qid)
+    question = quiz["question"]
+    responses = quiz["responses"]
 
     # Populate form (choices must be set before validate_on_submit)
     form.question.label.text = question["question_text"]
@@ -81,7 +68,7 @@ def index(qid=1):
             flash("Try again!", "warning")
             return redirect(url_for("main.index", qid=qid))
 
-    return render_template("index.html", form=form, qid=qid)
+    return render_template("index.html", form=form, qid=qid, number_questions=number_questions)
 
 
 @bp.route('/question', methods=['GET', 'POST'])
@@ -91,25 +78,20 @@ def add_question():
     if form.validate_on_submit():
         # Get the question text from the form
         question_text = form.question_text.data
-        # Create JSON (match the database table fields)
-        question = {"question_text": question_text}
+        # Create JSON (match the database table fields) with the 4 possible responses from the form
+        question = {"question_text": question_text, "responses": []}
+        for i in range(1, 5):
+            text_field = getattr(form, f"option_text_{i}")
+            correct_field = getattr(form, f"is_correct_{i}")
+            # Create the JSON for a response (match the fields im the database response table)
+            question["responses"].append({"response_text": text_field.data,
+                                          "is_correct": bool(correct_field.data)})
         try:
-            # Use POST request with the JSON
-            resp = requests.post(f"{API_BASE_URL}/question", json=question)
+            # Use one POST request so the question and responses are saved together or not at all
+            resp = get_api_client().post("/quiz", json=question)
             resp.raise_for_status()
-            # The request if successful will include the new row id in the response
-            qid = resp.json().get("id")
-            # Get the values for the 4 possible responses from the form
-            for i in range(1, 5):
-                text_field = getattr(form, f"option_text_{i}")
-                correct_field = getattr(form, f"is_correct_{i}")
-                # Create the JSON for a response (match the fields im the database response table)
-                response = {"response_text": text_field.data,
-                            "is_correct": bool(correct_field.data),
-                            "question_id": qid}
-                # Use HTTP post request to save to the database im the response table
-                resp = requests.post(f"{API_BASE_URL}/response", json=response)
-                resp.raise_for_status()
+            # The next quiz page fetches the questions again, including the new one
+            get_quiz_cache().invalidate()
             flash(f"Question saved!", "success")
         except requests.RequestException as e:
             flash(f"Failed to add question: {e}", "danger")
@@ -120,8 +102,7 @@ def add_question():
 @bp.route('/locations')
 def locations():
     """ Generates the page that displays a map showing where the Paralympics have been held """
-    fig = scatter_map()
-    fig_for_jinja = {"fig": fig.to_html(full_html=False, include_plotlyjs=True)}
+    fig_for_jinja = {"fig": chart_markup("map")}
     return render_template('locations.html', fig_html=fig_for_jinja)
 
 
@@ -131,11 +112,13 @@ def participants():
     if form.validate_on_submit():
         # Get the list of selected options from the form data
         paralympics_types = form.paralympics_types.data
-        figs = []
-        for p_type in paralympics_types:
-            fig = bar_chart(p_type)
-            fig_for_jinja = {"fig": fig.to_html(full_html=False, include_plotlyjs=True)}
-            figs.append(fig_for_jinja)
+        if current_app.config["CHART_RENDERING"] == "server":
+            # Build the charts at the same time rather than one after another
+            charts = fan_out(*(partial(chart_markup, "bar", p_type) for p_type in paralympics_types))
+        else:
+            # The browser builds the charts, so each one is only a placeholder
+            charts = [chart_markup("bar", p_type) for p_type in paralympics_types]
+        figs = [{"fig": chart} for chart in charts]
         return render_template('participants.html', figs=figs, form=form)
 
     # If the page is a GET request, or there is a form error, then return the page without charts
@@ -158,21 +141,45 @@ def trends():
         selected_type = form.selected_type.data
     else:
         selected_type = "countries"  # Default if no choice made
-    fig = line_chart(selected_type)
-    fig_for_jinja = {"fig": fig.to_html(full_html=False, include_plotlyjs=True)}
+    fig_for_jinja = {"fig": chart_markup("line", selected_type)}
     return render_template('trends.html', fig_html=fig_for_jinja, form=form)
 
 
+@bp.get('/charts/<chart>.json')
+@bp.get('/charts/<chart>/<param>.json')
+def chart_figure(chart, param=None):
+    """ Returns the Plotly figure JSON for a chart, e.g. /charts/line/sports.json
+
+    Used by the pages to load their charts after the page has been displayed. The response has
+    an ETag so the browser can revalidate its copy without downloading the figure again.
+    """
+    params = () if param is None else (param,)
+    if (chart, *params) not in CHART_VARIANTS:
+        abort(404)
+    figure = chart_json(chart, *params)
+    response = current_app.response_class(figure, mimetype="application/json")
+    response.headers["Cache-Control"] = "no-cache"
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@bp.get('/ready')
+def ready():
+    """ Readiness check for load balancers
+
+    Returns 503 until the chart warm-up has built every chart, or 200 straight away if warm-up is
+    disabled.
+    """
+    warmer = get_chart_warmer()
+    if warmer is not None and not warmer.ready.is_set():
+        return {"ready": False}, 503
+    return {"ready": True}
+
+
 @bp.get('/news')
 def news():
-    """ Generates the page that displays hacker news via algolia which allows for keyword search """
-    endpoint = 'https://hn.algolia.com/api/v1/search?query=paralympics&tags=story'
-    resp = requests.get(endpoint)
-    resp.raise_for_status()
-    data = resp.json()
-    stories = []
-    for hit in data.get('hits', [])[:20]:
-        title = hit.get('title') or '(no title)'
-        url = hit.get('url') or hit.get('story_url') or '(no url)'
-        stories.append({'title': title, 'url': url})
-    return render_template('news.html', stories=stories)
+    """ Generates the page that displays hacker news via algolia which allows for keyword search
+
+    The stories come from the news feed, which refreshes them in the background, see news.NewsFeed
+    """
+    return render_template('news.html', stories=get_news_feed().stories())
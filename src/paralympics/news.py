@@ -0,0 +1,114 @@
+""" News stories from the Hacker News search API, refreshed in the background.
+
+The /news page is served from the last list of stories that was fetched successfully. Once the
+list is older than the refresh interval the next page view starts a refresh in a background thread
+and is still served the old list straight away ("stale-while-revalidate"), so a slow or failing
+news API never holds up the page. Only the very first list is fetched while the page waits, and
+then for no longer than the timeout (plus at most one more socket read timeout if the server sends
+nothing at all).
+
+Responses larger than ``max_bytes`` are not read, and at most ``max_stories`` stories are kept.
+"""
+import json
+import threading
+import time
+
+import requests
+from flask import current_app
+
+
+class NewsFeed:
+    """ Last good list of news stories, refreshed out of band once it is stale.
+
+    Attributes:
+        url: search API URL, returning JSON with a list of ``hits``
+        timeout: seconds to wait for the whole news API response
+        interval: seconds a list of stories is served before it is refreshed
+        max_bytes: largest response body that is read
+        max_stories: number of stories kept
+        last_error: the error from the last refresh that failed, or None if it succeeded
+
+    Methods:
+        stories(self): Returns the last good list of stories, refreshing it if it is stale
+        refresh(self): Fetches the stories now, returns True if they were updated
+    """
+
+    def __init__(self, url, timeout=3, interval=300, max_bytes=1024 * 1024, max_stories=20):
+        self.url = url
+        self.timeout = timeout
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.max_stories = max_stories
+        self.last_error = None
+        self.session = requests.Session()
+        self._stories = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    def _fetch(self):
+        # The requests timeout applies to each read from the socket, so a server that sends a few
+        # bytes at a time could take much longer; the whole response must arrive by the deadline
+        deadline = time.monotonic() + self.timeout
+        with self.session.get(self.url, timeout=self.timeout, stream=True) as resp:
+            resp.raise_for_status()
+            if int(resp.headers.get("Content-Length") or 0) > self.max_bytes:
+                raise ValueError(f"News response is larger than {self.max_bytes} bytes")
+            body = bytearray()
+            while True:
+                # read1 returns whatever has arrived, rather than waiting for a full chunk
+                chunk = resp.raw.read1(64 * 1024, decode_content=True)
+                if not chunk:
+                    break
+                body.extend(chunk)
+                if len(body) > self.max_bytes:
+                    raise ValueError(f"News response is larger than {self.max_bytes} bytes")
+                if time.monotonic() > deadline:
+                    raise requests.Timeout(f"News response took longer than {self.timeout}s")
+        stories = []
+        for hit in json.loads(bytes(body)).get("hits", [])[:self.max_stories]:
+            title = hit.get("title") or "(no title)"
+            url = hit.get("url") or hit.get("story_url") or "(no url)"
+            stories.append({"title": title, "url": url})
+        return stories
+
+    def refresh(self):
+        # Only one refresh at a time; a caller that finds one running keeps the current list
+        if not self._refreshing.acquire(blocking=False):
+            return False
+        try:
+            stories = self._fetch()
+        except (requests.RequestException, ValueError) as e:
+            self.last_error = e
+            # Try again after another interval rather than on every page view
+            with self._lock:
+                self._fetched_at = time.monotonic()
+            return False
+        finally:
+            self._refreshing.release()
+        with self._lock:
+            self._stories = stories
+            self._fetched_at = time.monotonic()
+        self.last_error = None
+        return True
+
+    def stories(self):
+        """ Returns the last good list of stories, an empty list if none has been fetched yet
+
+        Fetches the first list before returning. After that a stale list is returned as it is and
+        refreshed in a background thread.
+        """
+        with self._lock:
+            stories, age = self._stories, time.monotonic() - self._fetched_at
+        if stories is None and not self._fetched_at:
+            self.refresh()
+            with self._lock:
+                return self._stories or []
+        if age >= self.interval and not self._refreshing.locked():
+            threading.Thread(target=self.refresh, name="news-refresh", daemon=True).start()
+        return stories or []
+
+
+def get_news_feed():
+    """ Returns the news feed of the current Flask app """
+    return current_app.extensions["news_feed"]
@@ -0,0 +1,24 @@
+// Draws the charts whose placeholders were rendered in the page by chart_placeholder().
+// The figure JSON for every chart on the page is requested at the same time.
+document.addEventListener("DOMContentLoaded", function () {
+    document.querySelectorAll("[data-figure-url]").forEach(function (el) {
+        fetch(el.dataset.figureUrl)
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status + " " + response.statusText);
+                }
+                return response.json();
+            })
+            .then(function (figure) {
+                el.innerHTML = "";
+                return Plotly.newPlot(el, figure.data, figure.layout, {responsive: true});
+            })
+            .catch(function (error) {
+                el.innerHTML = "";
+                const message = document.createElement("p");
+                message.className = "alert alert-warning";
+                message.textContent = "The chart could not be loaded (" + error.message + ").";
+                el.appendChild(message);
+            });
+    });
+});
@@ -0,0 +1,77 @@
+""" Background warm-up of the figure cache.
+
+Every chart the app can show (see CHART_VARIANTS) is built in a small thread pool when the app
+starts, so the first visitor to each page does not wait for pandas and Plotly. The variants are
+then built again every CHART_WARMUP_INTERVAL seconds; while the data is unchanged each one is a
+figure cache hit, and when the data version changes the new figures are built before they are
+requested.
+
+Threads are used rather than processes because the figures must end up in this process's figure
+cache.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import current_app
+
+from paralympics.charts import CHART_VARIANTS, render_chart
+
+
+class ChartWarmer:
+    """ Builds every chart variant in the background and keeps them up to date.
+
+    Attributes:
+        app: Flask app whose figure cache is filled
+        workers: number of charts built at the same time
+        interval: seconds between checks for changed data
+        ready: set once every chart variant has been built
+
+    Methods:
+        start(self): Starts the background thread
+        stop(self): Stops the background thread
+        warm(self): Builds every chart variant once, returns True if they all succeeded
+    """
+
+    def __init__(self, app, workers=2, interval=60):
+        self.app = app
+        self.workers = workers
+        self.interval = interval
+        self.ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _render(self, variant):
+        with self.app.app_context():
+            render_chart(*variant)
+
+    def warm(self):
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix="chart-warmup") as executor:
+            futures = {executor.submit(self._render, v): v for v in CHART_VARIANTS}
+            wait(futures)
+        failed = [(futures[f], f.exception()) for f in futures if f.exception() is not None]
+        for variant, exc in failed:
+            self.app.logger.warning("Could not build chart %s: %s", variant, exc)
+        return not failed
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if self.warm():
+                self.ready.set()
+            self._stopped.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="chart-warmer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def get_chart_warmer():
+    """ Returns the chart warmer of the current Flask app, or None if warm-up is disabled """
+    return current_app.extensions.get("chart_warmer")
@@ -1,6 +1,9 @@
+import json
+import os
 import shutil
 import threading
 import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from urllib.request import urlopen
 
@@ -23,24 +26,21 @@ def wait_for_http(url, timeout=5):
 
 
 @pytest.fixture(scope="session", autouse=True)
-def api_server():
+def api_server(tmp_path_factory):
     """Start the REST API server before Dash app tests.
 
-     Makes a copy of the database before the server starts, and to replace
-     the original at the end of the tests.
-     NB this is not a recommended approach, this will be covered when the REST API is tested
+     The server uses a copy of the database, so writes made by the tests never reach the
+     packaged paralympics.db. Copying the file back afterwards is not safe in WAL mode, where
+     recent commits can still be in the paralympics.db-wal file.
     """
-
-    # Create a copy of the database
     root = Path(__file__).parent.parent
     _orig_db = root.joinpath("src", "data", "paralympics.db")
-    _backup_db = _orig_db.with_suffix(_orig_db.suffix + ".orig")
-
     if not _orig_db.exists():
         raise RuntimeError(f"Original DB not found: {_orig_db}")
-
-    # backup original
-    shutil.copy2(_orig_db, _backup_db)
+    db_copy = tmp_path_factory.mktemp("api").joinpath("paralympics.db")
+    shutil.copy2(_orig_db, db_copy)
+    # ApiConfig reads the environment when data.api is first imported
+    os.environ["PARALYMPICS_DATABASE_FILE"] = str(db_copy)
 
     from data.api import app
 
@@ -60,13 +60,18 @@ def api_server():
 
     yield
 
-    # Teardown: restore original DB
-    if _backup_db.exists():
-        shutil.copy2(_backup_db, _orig_db)
-        try:
-            _backup_db.unlink()
-        except Exception:
-            pass
+
+@pytest.fixture()
+def paralympics_data(tmp_path):
+    """Create a ParalympicsData instance using a temporary copy of the database"""
+    from data.paralympics_data import ParalympicsData
+
+    root = Path(__file__).parent.parent
+    db_copy = tmp_path.joinpath("paralympics.db")
+    shutil.copy2(root.joinpath("src", "data", "paralympics.db"), db_copy)
+    data = ParalympicsData(db_copy, pool_size=2)
+    yield data
+    data.close()
 
 
 @pytest.fixture(scope="session")
@@ -109,3 +114,51 @@ def app():
 def client(app):
     """ Create a flask test client """
     yield app.test_client()
+
+
+class _NewsHandler(BaseHTTPRequestHandler):
+    """Replies to every GET with the status, delay and body set on the news_server fixture"""
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        time.sleep(server.delay)
+        self.send_response(server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(server.body)))
+        self.end_headers()
+        try:
+            if not server.drip:
+                self.wfile.write(server.body)
+                return
+            # Send the body 16 bytes at a time, like a server that is very slow but never idle
+            for start in range(0, len(server.body), 16):
+                self.wfile.write(server.body[start:start + 16])
+                self.wfile.flush()
+                time.sleep(server.drip)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture()
+def news_server():
+    """Start a local HTTP server that stands in for the Hacker News search API
+
+    Set status, delay (seconds before replying), drip (seconds between 16 byte parts of the body)
+    or body on the server to change its replies; by default it returns 25 stories at once. The
+    search URL is in server.url.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _NewsHandler)
+    server.daemon_threads = True
+    server.status, server.delay, server.drip, server.requests = 200, 0, 0, 0
+    hits = [{"title": f"Story {i}", "url": f"https://example.com/{i}"} for i in range(25)]
+    server.body = json.dumps({"hits": hits}).encode()
+    server.url = f"http://127.0.0.1:{server.server_port}/api/v1/search?query=paralympics"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,237 @@
+import io
+import json
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+import requests
+
+API_BASE_URL = "http://127.0.0.1:8000"
+
+
+def test_get_returns_etag_and_honours_if_none_match():
+    """
+    GIVEN the REST API
+    WHEN a table is requested, and then requested again with If-None-Match set to its ETag
+    THEN the second response should be 304 Not Modified with no body
+    """
+    first = requests.get(f"{API_BASE_URL}/games")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert "Last-Modified" in first.headers
+    second = requests.get(f"{API_BASE_URL}/games", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+
+
+def test_write_changes_etag_of_table_only():
+    """
+    GIVEN the REST API
+    WHEN a new question is added
+    THEN the ETag of /question should change
+    AND the ETag of /all, which does not use the question table, should not
+    """
+    question_etag = requests.get(f"{API_BASE_URL}/question").headers["ETag"]
+    all_etag = requests.get(f"{API_BASE_URL}/all").headers["ETag"]
+    requests.post(f"{API_BASE_URL}/question", json={"question_text": "ETag question"})
+    assert requests.get(f"{API_BASE_URL}/question").headers["ETag"] != question_etag
+    assert requests.get(f"{API_BASE_URL}/all").headers["ETag"] == all_etag
+
+
+def test_quiz_question_returns_question_responses_and_count():
+    """
+    GIVEN the REST API
+    WHEN quiz question 1 is requested
+    THEN the question, its 4 responses and the number of questions should be returned
+    """
+    quiz = requests.get(f"{API_BASE_URL}/quiz/1").json()
+    assert quiz["question"]["id"] == 1
+    assert [r["question_id"] for r in quiz["responses"]] == [1, 1, 1, 1]
+    assert quiz["question_count"] >= 4
+
+
+def test_quiz_question_not_found_still_returns_count():
+    """
+    GIVEN the REST API
+    WHEN a quiz question that does not exist is requested
+    THEN question should be null and the number of questions should still be returned
+    """
+    quiz = requests.get(f"{API_BASE_URL}/quiz/99999").json()
+    assert quiz["question"] is None
+    assert quiz["responses"] == []
+    assert quiz["question_count"] >= 4
+
+
+def test_quiz_returns_every_question_with_its_responses():
+    """
+    GIVEN the REST API
+    WHEN the whole quiz is requested, and then requested again with If-None-Match set to its ETag
+    THEN every question should be returned with its responses, and the second response be 304
+    """
+    resp = requests.get(f"{API_BASE_URL}/quiz")
+    quiz = resp.json()
+    assert quiz["question_count"] == len(quiz["questions"])
+    assert quiz["questions"][0]["id"] == 1
+    assert [r["question_id"] for r in quiz["questions"][0]["responses"]] == [1, 1, 1, 1]
+    again = requests.get(f"{API_BASE_URL}/quiz", headers={"If-None-Match": resp.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_write_by_another_process_changes_etag():
+    """
+    GIVEN the REST API
+    WHEN a question is added to its database file by another connection, not through the API
+    THEN revalidating /quiz with the old ETag should return the quiz with the new question
+    """
+    first = requests.get(f"{API_BASE_URL}/quiz")
+    with sqlite3.connect(os.environ["PARALYMPICS_DATABASE_FILE"]) as conn:
+        conn.execute("INSERT INTO question (question_text) VALUES ('Added outside the API')")
+    conn.close()
+    second = requests.get(f"{API_BASE_URL}/quiz", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert second.json()["questions"][-1]["question_text"] == "Added outside the API"
+
+
+def test_table_is_paged_with_next_links():
+    """
+    GIVEN the REST API
+    WHEN the games table is requested with limit=10 and the next links are followed
+    THEN each page should have at most 10 rows, in id order, and together include every game
+    """
+    all_ids = sorted(g["id"] for g in requests.get(f"{API_BASE_URL}/games").json())
+    ids = []
+    resp = requests.get(f"{API_BASE_URL}/games", params={"limit": 10})
+    while True:
+        page = resp.json()
+        assert len(page) <= 10
+        ids.extend(g["id"] for g in page)
+        if "next" not in resp.links:
+            break
+        resp = requests.get(resp.links["next"]["url"])
+    assert ids == all_ids
+
+
+def test_search_with_fields_returns_only_those_columns():
+    """
+    GIVEN the REST API
+    WHEN responses are searched by question_id with fields=id,response_text
+    THEN each row should only contain the id and response_text
+    """
+    rows = requests.get(f"{API_BASE_URL}/response/search",
+                        params={"question_id": 1, "fields": "id,response_text"}).json()
+    assert len(rows) == 4
+    assert all(set(r) == {"id", "response_text"} for r in rows)
+
+
+def test_unknown_field_is_bad_request():
+    """
+    GIVEN the REST API
+    WHEN a table is requested with a field that is not a column
+    THEN the response should be 400 Bad Request
+    """
+    resp = requests.get(f"{API_BASE_URL}/games", params={"fields": "id,not_a_column"})
+    assert resp.status_code == 400
+
+
+def test_all_streams_ndjson():
+    """
+    GIVEN the REST API
+    WHEN /all is requested with Accept: application/x-ndjson
+    THEN the same rows as the JSON response should be streamed, one JSON object per line
+    """
+    rows = requests.get(f"{API_BASE_URL}/all").json()
+    resp = requests.get(f"{API_BASE_URL}/all", headers={"Accept": "application/x-ndjson"},
+                        stream=True)
+    assert resp.headers["Content-Type"].startswith("application/x-ndjson")
+    streamed = [json.loads(line) for line in resp.iter_lines() if line]
+    assert streamed == rows
+
+
+def test_all_returns_csv_when_accepted():
+    """
+    GIVEN the REST API
+    WHEN /all is requested with Accept: text/csv
+    THEN a CSV file with a header row and one line per row of the JSON response should be returned
+    """
+    rows = requests.get(f"{API_BASE_URL}/all").json()
+    resp = requests.get(f"{API_BASE_URL}/all", headers={"Accept": "text/csv"})
+    assert resp.headers["Content-Type"].startswith("text/csv")
+    df = pd.read_csv(io.BytesIO(resp.content))
+    assert list(df.columns) == list(rows[0])
+    assert len(df) == len(rows)
+
+
+def test_table_returns_arrow_stream():
+    """
+    GIVEN the REST API and pyarrow installed
+    WHEN /games is requested with format=arrow
+    THEN an Arrow IPC stream with the same rows as the JSON response should be returned
+    """
+    pa = pytest.importorskip("pyarrow")
+    rows = requests.get(f"{API_BASE_URL}/games").json()
+    resp = requests.get(f"{API_BASE_URL}/games", params={"format": "arrow"})
+    assert resp.headers["Content-Type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(resp.content).read_all()
+    assert table.column("id").to_pylist() == [r["id"] for r in rows]
+
+
+def test_all_search_filters_and_sorts_in_sql():
+    """
+    GIVEN the REST API
+    WHEN /all/search is requested for winter games from 2000 in descending year order
+    THEN only those rows should be returned, newest first
+    """
+    rows = requests.get(f"{API_BASE_URL}/all/search",
+                        params={"event_type": "winter", "year__gte": 2000, "order_by": "-year",
+                                "fields": "event_type,year"}).json()
+    years = [r["year"] for r in rows]
+    assert years and years == sorted(years, reverse=True) and min(years) >= 2000
+    assert {r["event_type"] for r in rows} == {"winter"}
+
+
+def test_search_with_unknown_operator_is_bad_request():
+    """
+    GIVEN the REST API
+    WHEN games are searched with an unknown operator
+    THEN the response should be 400 Bad Request
+    """
+    resp = requests.get(f"{API_BASE_URL}/games/search", params={"year__between": "2000"})
+    assert resp.status_code == 400
+
+
+def test_aggregate_returns_one_row_per_group():
+    """
+    GIVEN the REST API
+    WHEN games are aggregated by event_type with count(*)
+    THEN there should be a row for summer and winter whose counts add up to the number of games
+    """
+    rows = requests.get(f"{API_BASE_URL}/games/aggregate",
+                        params={"group_by": "event_type", "metrics": "count(*)"}).json()
+    assert [r["event_type"] for r in rows] == ["summer", "winter"]
+    assert sum(r["count"] for r in rows) == len(requests.get(f"{API_BASE_URL}/games").json())
+
+
+def test_aggregate_with_invalid_metric_is_bad_request():
+    """
+    GIVEN the REST API
+    WHEN /all/aggregate is requested with an unknown metric function
+    THEN the response should be 400 Bad Request
+    """
+    resp = requests.get(f"{API_BASE_URL}/all/aggregate",
+                        params={"group_by": "year", "metrics": "median(participants)"})
+    assert resp.status_code == 400
+
+
+def test_table_returns_compact_json():
+    """
+    GIVEN the REST API
+    WHEN /games is requested with format=compact
+    THEN the column names should be sent once, followed by each row as an array
+    """
+    rows = requests.get(f"{API_BASE_URL}/games").json()
+    resp = requests.get(f"{API_BASE_URL}/games", params={"format": "compact"})
+    assert resp.headers["Content-Type"] == "application/vnd.paralympics.compact+json"
+    body = resp.json()
+    assert body["columns"] == list(rows[0])
+    assert [dict(zip(body["columns"], row)) for row in body["rows"]] == rows
@@ -0,0 +1,24 @@
+from paralympics.api_client import ApiClient
+
+API_BASE_URL = "http://127.0.0.1:8000"
+
+
+def test_iter_rows_follows_next_links_to_every_row():
+    """
+    GIVEN an API client
+    WHEN the rows of the games table are iterated with a page size of 7
+    THEN every game should be yielded exactly once, in id order, over several pages
+    """
+    api = ApiClient(API_BASE_URL)
+    all_ids = sorted(g["id"] for g in api.get("/games").json())
+    pages = []
+    original_get = api.get
+
+    def counting_get(path, **kwargs):
+        pages.append(path)
+        return original_get(path, **kwargs)
+
+    api.get = counting_get
+    ids = [row["id"] for row in api.iter_rows("/games", page_size=7)]
+    assert ids == all_ids
+    assert len(pages) >= len(all_ids) // 7
@@ -0,0 +1,95 @@
+from paralympics.api_client import ApiClient
+from paralympics.cache import DatasetCache, FigureCache, QuizCache
+
+API_BASE_URL = "http://127.0.0.1:8000"
+
+
+def test_dataset_is_typed_and_reused():
+    """
+    GIVEN a dataset cache
+    WHEN the /all dataset is requested twice within the ttl
+    THEN the same DataFrame should be returned
+    AND latitude/longitude should be numeric and year an integer
+    """
+    cache = DatasetCache(ApiClient(API_BASE_URL), ttl=60)
+    df = cache.get("/all")
+    assert cache.get("/all") is df
+    assert df["latitude"].dtype.kind == "f"
+    assert df["longitude"].dtype.kind == "f"
+    assert df["year"].dtype.kind == "i"
+
+
+def test_unchanged_dataset_is_kept_after_revalidation():
+    """
+    GIVEN a dataset cache with a ttl of 0
+    WHEN the /all dataset is requested twice and the data has not changed
+    THEN the cached DataFrame and version should be kept
+    """
+    cache = DatasetCache(ApiClient(API_BASE_URL), ttl=0)
+    df = cache.get("/all")
+    version = cache.version("/all")
+    assert cache.get("/all") is df
+    assert cache.version("/all") == version
+
+
+def test_figure_cache_evicts_least_recently_used():
+    """
+    GIVEN a figure cache limited to 10 bytes holding two 4 byte values
+    WHEN the first value is read and then a third 4 byte value is added
+    THEN the second value, now the least recently used, should be evicted
+    """
+    cache = FigureCache(max_bytes=10)
+    cache.set("a", "aaaa")
+    cache.set("b", "bbbb")
+    cache.get("a")
+    cache.set("c", "cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.size_bytes == 8
+
+
+class CountingApiClient(ApiClient):
+    """ ApiClient that counts its GET requests """
+
+    gets = 0
+
+    def get(self, path, **kwargs):
+        self.gets += 1
+        return super().get(path, **kwargs)
+
+
+def test_quiz_is_fetched_once_within_ttl():
+    """
+    GIVEN a quiz cache
+    WHEN two questions are read within the ttl
+    THEN the quiz should be fetched with one request, and each question have its own responses
+    """
+    api = CountingApiClient(API_BASE_URL)
+    cache = QuizCache(api, ttl=60)
+    first, second = cache.get(1), cache.get(2)
+    assert api.gets == 1
+    assert first["question"]["id"] == 1 and second["question"]["id"] == 2
+    assert {r["question_id"] for r in first["responses"]} == {1}
+    assert cache.get(99999) == {"question_count": first["question_count"], "question": None,
+                                "responses": []}
+
+
+def test_quiz_is_fetched_again_after_invalidate():
+    """
+    GIVEN a quiz cache holding the quiz
+    WHEN a question is added through the API and the cache is invalidated
+    THEN the next read should include the new question and a new version
+    """
+    api = ApiClient(API_BASE_URL)
+    cache = QuizCache(api, ttl=60)
+    count = cache.get(1)["question_count"]
+    version = cache.version()
+    new = api.post("/quiz", json={"question_text": "Cached quiz question",
+                                  "responses": [{"response_text": "Yes", "is_correct": True}]})
+    new_id = new.json()["question"]["id"]
+    assert cache.get(new_id)["question"] is None
+    cache.invalidate()
+    quiz = cache.get(new_id)
+    assert quiz["question_count"] == count + 1
+    assert quiz["question"]["question_text"] == "Cached quiz question"
+    assert cache.version() != version
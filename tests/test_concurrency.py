@@ -0,0 +1,77 @@
+import gc
+import time
+
+import pytest
+from flask import current_app
+
+from paralympics import create_app
+from paralympics.concurrency import fan_out
+
+
+def test_fan_out_runs_calls_at_the_same_time(app):
+    """
+    GIVEN an app context
+    WHEN two calls that each take 0.3 seconds are fanned out
+    THEN both results should be returned in order in less time than running them one after another
+    """
+    def slow(value):
+        time.sleep(0.3)
+        return value
+
+    with app.app_context():
+        start = time.perf_counter()
+        results = fan_out(lambda: slow(1), lambda: slow(2))
+        elapsed = time.perf_counter() - start
+    assert results == [1, 2]
+    assert elapsed < 0.55
+
+
+def test_fan_out_calls_can_use_the_app_context(app):
+    """
+    GIVEN an app context
+    WHEN the fanned out calls read current_app
+    THEN each call should see the same app as the caller
+    """
+    with app.app_context():
+        names = fan_out(lambda: current_app.name, lambda: current_app.name)
+    assert names == [app.name, app.name]
+
+
+def test_fan_out_raises_the_first_error(app):
+    """
+    GIVEN an app context
+    WHEN one of the fanned out calls raises an exception
+    THEN fan_out should raise that exception
+    """
+    def fail():
+        raise ValueError("broken")
+
+    with app.app_context():
+        with pytest.raises(ValueError, match="broken"):
+            fan_out(lambda: 1, fail)
+
+
+def test_fan_out_times_out(app):
+    """
+    GIVEN an app context
+    WHEN a fanned out call takes longer than the timeout
+    THEN a TimeoutError should be raised
+    """
+    with app.app_context():
+        with pytest.raises(TimeoutError):
+            fan_out(lambda: time.sleep(1), lambda: None, timeout=0.1)
+
+
+def test_fan_out_pool_is_shut_down_with_the_app():
+    """
+    GIVEN an app whose fan out pool has run some calls
+    WHEN the app is garbage collected
+    THEN the pool should be shut down rather than left running
+    """
+    app = create_app()
+    executor = app.extensions["executor"]
+    with app.app_context():
+        fan_out(lambda: 1, lambda: 2)
+    del app
+    gc.collect()
+    assert executor._shutdown
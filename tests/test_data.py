@@ -0,0 +1,479 @@
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from data.index_advisor import IndexAdvisor
+from data.paralympics_data import CHANGES_TABLE
+
+
+def test_connections_are_reused(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance with a pool of 2 connections
+    WHEN several queries are made one after another
+    THEN no more than one connection should have been opened
+    """
+    paralympics_data.get_table_as_json("question")
+    paralympics_data.get_row_by_id("question", 1)
+    paralympics_data.search_table("response", {"question_id": "1"})
+    assert paralympics_data.pool._opened == 1
+
+
+def test_add_row_returns_inserted_row(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN a new question row is added
+    THEN the inserted row should be returned with its new id
+    """
+    row = paralympics_data.add_row("question", {"question_text": "New question", "unknown": 1})
+    assert row["question_text"] == "New question"
+    assert paralympics_data.get_row_by_id("question", row["id"]) == row
+
+
+def test_closed_pool_rejects_queries(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN it is closed
+    THEN further queries should raise a RuntimeError
+    """
+    paralympics_data.close()
+    with pytest.raises(RuntimeError):
+        paralympics_data.get_table_as_json("question")
+
+
+def test_schema_catalog_describes_tables(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN the schema catalog for the response table is read
+    THEN it should include the columns, primary key and foreign key to question
+    """
+    schema = paralympics_data.catalog.table("response")
+    assert schema.column_names == ["id", "question_id", "response_text", "is_correct"]
+    assert schema.primary_key == "id"
+    assert ("question_id", "question", "id") in schema.foreign_keys
+
+
+def test_schema_catalog_refreshes_on_schema_change(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN a column is added to a table outside the catalog
+    THEN the catalog should be reloaded on the next query of that table
+    """
+    with paralympics_data.pool.connection() as conn:
+        conn.execute("ALTER TABLE score ADD COLUMN team TEXT")
+    row = paralympics_data.add_row("score", {"first_name": "Ann", "team": "GB"})
+    assert row["team"] == "GB"
+    assert "team" in paralympics_data.catalog.table("score").column_names
+
+
+def test_add_quiz_question_saves_question_and_responses(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN a question is added with 2 responses
+    THEN the question and both responses should be returned with their new ids
+    """
+    result = paralympics_data.add_quiz_question(
+        {"question_text": "Batched question"},
+        [{"response_text": "Yes", "is_correct": True}, {"response_text": "No", "is_correct": False}],
+    )
+    qid = result["question"]["id"]
+    assert [r["question_id"] for r in result["responses"]] == [qid, qid]
+    assert paralympics_data.get_quiz_question(qid)["responses"] == result["responses"]
+
+
+def test_add_quiz_question_is_atomic(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN a question is added with a response that is missing its required text
+    THEN an error should be raised and no question should be saved
+    """
+    count = len(paralympics_data.get_table_as_json("question"))
+    with pytest.raises(Exception):
+        paralympics_data.add_quiz_question(
+            {"question_text": "Orphan question"},
+            [{"response_text": "Yes", "is_correct": True}, {"is_correct": False}],
+        )
+    assert len(paralympics_data.get_table_as_json("question")) == count
+
+
+def test_add_quiz_question_uses_defaults_for_missing_response_columns(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN a question is added with one response that gives is_correct and one that leaves it out
+    THEN both responses should be saved in order, the second with the is_correct default (false)
+    """
+    result = paralympics_data.add_quiz_question(
+        {"question_text": "Mixed responses"},
+        [{"response_text": "a", "is_correct": True}, {"response_text": "b"}],
+    )
+    assert [(r["response_text"], bool(r["is_correct"])) for r in result["responses"]] == \
+        [("a", True), ("b", False)]
+
+
+def test_stream_table_yields_columns_then_batches(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN the games table is streamed in batches of 10 rows
+    THEN the column names should come first, then batches of at most 10 rows covering every game
+    """
+    batches = paralympics_data.stream_table("games", fields=["id", "year"], batch_size=10)
+    assert next(batches) == ["id", "year"]
+    sizes = [len(batch) for batch in batches]
+    assert max(sizes) == 10
+    assert sum(sizes) == len(paralympics_data.get_table_as_json("games"))
+
+
+def test_stream_table_rejects_unknown_field_immediately(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN a stream is requested with a field that is not a column
+    THEN a ValueError should be raised before any rows are read
+    """
+    with pytest.raises(ValueError):
+        paralympics_data.stream_table("games", fields=["nope"])
+
+
+def test_index_advisor_indexes_foreign_keys(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance and an IndexAdvisor
+    WHEN the suggested indexes are created
+    THEN a search on response.question_id should use an index instead of scanning the table
+    """
+    with paralympics_data.pool.connection() as conn:
+        # the API server may already have created it in the source database
+        conn.execute("DROP INDEX IF EXISTS ix_response_question_id")
+    advisor = IndexAdvisor(paralympics_data)
+    assert ("response", "question_id") in advisor.suggestions()
+    assert any(d.startswith("SCAN") for d in advisor.explain("response", ["question_id"]))
+    created = advisor.create_indexes()
+    assert "ix_response_question_id" in created
+    assert ("response", "question_id") not in advisor.suggestions()
+    plan = advisor.explain("response", ["question_id"])
+    assert any("ix_response_question_id" in d for d in plan)
+    # the catalog has reloaded with the new index
+    indexes = paralympics_data.catalog.table("response").indexes
+    assert "ix_response_question_id" in [i.name for i in indexes]
+
+
+def test_index_advisor_suggests_hot_filter_columns(paralympics_data):
+    """
+    GIVEN an IndexAdvisor with a threshold of 3 uses
+    WHEN the games table is searched on event_type 3 times
+    THEN games.event_type should be suggested and reported as a full table scan
+    """
+    advisor = IndexAdvisor(paralympics_data, min_uses=3)
+    for _ in range(3):
+        paralympics_data.search_table("games", {"event_type": "summer"})
+    assert ("games", "event_type") in advisor.suggestions()
+    item = next(i for i in advisor.report() if i["table"] == "games")
+    assert item["columns"] == ["event_type"] and item["uses"] == 3 and item["scan"]
+
+
+def test_all_data_bytes_are_reused_until_a_joined_table_changes(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN the serialized all data is requested twice, then after a country is added
+    THEN the same bytes should be returned until the write, and rebuilt after it
+    """
+    body = paralympics_data.get_all_data_bytes("json")
+    assert json.loads(body) == paralympics_data.get_all_data()
+    assert paralympics_data.get_all_data_bytes("json") is body
+    paralympics_data.add_row("question", {"question_text": "Not in the join?"})
+    paralympics_data.add_row("country", {"country_name": "Atlantis"})
+    assert paralympics_data.get_all_data_bytes("json") is not body
+
+
+def test_external_writes_invalidate_all_data_bytes(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance with cached all data bytes
+    WHEN another connection commits a change to the host table
+    THEN the change should be detected and the bytes rebuilt with the new data
+    """
+    body = paralympics_data.get_all_data_bytes("csv")
+    assert paralympics_data.detect_external_writes() is False
+    conn = sqlite3.connect(paralympics_data.database_file)
+    with conn:
+        conn.execute("UPDATE host SET place_name = 'Elsewhere' WHERE id = 1")
+    conn.close()
+    assert paralympics_data.detect_external_writes() is True
+    new_body = paralympics_data.get_all_data_bytes("csv")
+    assert new_body != body and b"Elsewhere" in new_body
+
+
+def test_external_writes_to_any_table_are_detected(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance that has checked the question table
+    WHEN another connection adds a question, and then the instance adds one itself
+    THEN the other connection's question should bump the question version
+    AND the instance's own question should bump it once, not again when it is next checked
+    """
+    assert paralympics_data.detect_external_writes(["question"]) is False
+    version = paralympics_data.versions.version(["question"])
+    with sqlite3.connect(paralympics_data.database_file) as conn:
+        conn.execute("INSERT INTO question (question_text) VALUES ('External')")
+    conn.close()
+    assert paralympics_data.detect_external_writes(["question"]) is True
+    assert paralympics_data.versions.version(["question"]) != version
+    paralympics_data.add_row("question", {"question_text": "Internal"})
+    version = paralympics_data.versions.version(["question"])
+    assert paralympics_data.detect_external_writes(["question"]) is False
+    assert paralympics_data.versions.version(["question"]) == version
+
+
+def test_writes_are_counted_in_the_changes_table(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN the instance and another connection each add a response
+    THEN the changes table should count both writes to the response table
+    AND the changes table should not be listed as one of the data tables
+    """
+    assert CHANGES_TABLE not in paralympics_data.tables
+    paralympics_data.add_row("response", {"question_id": 1, "response_text": "Internal"})
+    with sqlite3.connect(paralympics_data.database_file) as conn:
+        conn.execute("INSERT INTO response (question_id, response_text) VALUES (1, 'External')")
+        changes = conn.execute(f"SELECT changes FROM {CHANGES_TABLE} "
+                               "WHERE table_name = 'response'").fetchone()[0]
+    conn.close()
+    assert changes == 2
+    assert paralympics_data.detect_external_writes(["response"]) is True
+
+
+def test_query_table_filter_operators(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN games are queried with range, IN, prefix and null filters, sorted and limited
+    THEN only the matching rows should be returned in the requested order
+    """
+    rows, cursor = paralympics_data.query_table(
+        "games", {"year__gte": "2000", "year__lt": "2010", "event_type__in": "summer,winter",
+                  "participants__isnull": "false"},
+        fields=["year"], order_by="-year", limit=3)
+    assert [r["year"] for r in rows] == [2008, 2006, 2004]
+    assert cursor is None
+    rows, _ = paralympics_data.query_table("host", {"place_name__startswith": "lon"})
+    assert [r["place_name"] for r in rows] == ["London"]
+
+
+@pytest.mark.parametrize("filters, order_by", [
+    ({"year__between": "2000"}, None),
+    ({"nope__gte": "2000"}, None),
+    ({"participants__isnull": "maybe"}, None),
+    ({}, "-nope"),
+])
+def test_query_table_rejects_invalid_filters(paralympics_data, filters, order_by):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN a query has an unknown operator, an unknown column, an invalid value or an unknown sort
+    THEN a ValueError should be raised
+    """
+    with pytest.raises(ValueError):
+        paralympics_data.query_table("games", filters, order_by=order_by)
+
+
+def test_aggregate_table_groups_and_calculates_ratios(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN summer games up to 1968 are aggregated by year with a sum and a female:total ratio
+    THEN there should be one row per year with the totals calculated by SQLite
+    """
+    rows = paralympics_data.aggregate_table(
+        "games", "year", "sum(participants),ratio(participants_f,participants)",
+        {"event_type": "summer", "year__lte": "1968"})
+    games = paralympics_data.query_table("games", {"event_type": "summer", "year__lte": "1968"})[0]
+    assert [r["year"] for r in rows] == sorted(g["year"] for g in games)
+    for row, game in zip(rows, sorted(games, key=lambda g: g["year"])):
+        assert row["sum_participants"] == game["participants"]
+        expected = None
+        if game["participants_f"] is not None:
+            expected = pytest.approx(game["participants_f"] / game["participants"])
+        assert row["ratio_participants_f_participants"] == expected
+
+
+@pytest.mark.parametrize("group_by, metrics", [
+    ("year", "median(participants)"),
+    ("nope", "count(*)"),
+    ("year", "ratio(participants)"),
+    ("year", ""),
+])
+def test_aggregate_table_rejects_invalid_metrics(paralympics_data, group_by, metrics):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN an aggregate has an unknown function or column, the wrong arguments or no metrics
+    THEN a ValueError should be raised
+    """
+    with pytest.raises(ValueError):
+        paralympics_data.aggregate_table("games", group_by, metrics)
+
+
+def test_connections_use_wal_mode(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance with the default pragmas
+    WHEN a pooled connection is used
+    THEN the database should be in WAL mode with synchronous set to NORMAL
+    """
+    with paralympics_data.pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+
+def test_invalid_pragma_is_rejected(paralympics_data):
+    """
+    GIVEN a database file
+    WHEN a ParalympicsData instance is created with an unknown synchronous setting
+    THEN a ValueError should be raised
+    """
+    from data.paralympics_data import ParalympicsData
+
+    with pytest.raises(ValueError):
+        ParalympicsData(paralympics_data.database_file, pragmas={"synchronous": "sometimes"})
+
+
+def test_concurrent_writes_all_succeed(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance
+    WHEN 8 threads each add 20 questions at the same time
+    THEN every question should be saved with its own id
+    """
+    count = len(paralympics_data.get_table_as_json("question"))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        rows = list(executor.map(
+            lambda i: paralympics_data.add_row("question", {"question_text": f"Burst {i}"}),
+            range(160)))
+    assert len({row["id"] for row in rows}) == 160
+    assert len(paralympics_data.get_table_as_json("question")) == count + 160
+
+
+def test_write_queue_commits_waiting_writes_together(paralympics_data):
+    """
+    GIVEN a write queue whose writer is busy with a first write
+    WHEN three more writes are queued, one of which fails
+    THEN the other two should be committed together in one transaction, without the failed one
+    """
+    from data.writer import WriteQueue
+
+    writer = WriteQueue(lambda: sqlite3.connect(paralympics_data.database_file,
+                                                check_same_thread=False))
+    started, release = threading.Event(), threading.Event()
+
+    def first(conn):
+        started.set()
+        release.wait(5)
+
+    def insert(text):
+        return lambda conn: conn.execute("INSERT INTO question (question_text) VALUES (?)",
+                                         (text,)).lastrowid
+
+    def fail(conn):
+        conn.execute("INSERT INTO question (question_text) VALUES ('Failed')")
+        raise ValueError("write failed")
+
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            executor.submit(writer.submit, first)
+            started.wait(5)
+            futures = [executor.submit(writer.submit, w)
+                       for w in (insert("Grouped 1"), fail, insert("Grouped 2"))]
+            time.sleep(0.2)  # let the writes reach the queue
+            release.set()
+            with pytest.raises(ValueError):
+                futures[1].result()
+            assert futures[0].result() and futures[2].result()
+    finally:
+        writer.close()
+    assert writer.commits == 2
+    texts = [q["question_text"] for q in paralympics_data.get_table_as_json("question")]
+    assert "Grouped 1" in texts and "Grouped 2" in texts and "Failed" not in texts
+
+
+def test_memory_mode_reads_from_memory_and_writes_through(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance in memory mode that flushes after every commit
+    WHEN the database file is changed directly, and then a question is added through the instance
+    THEN the direct change should not be read, and the added question should be in the file
+    """
+    from data.paralympics_data import ParalympicsData
+
+    data = ParalympicsData(paralympics_data.database_file, mode="memory")
+    try:
+        with sqlite3.connect(paralympics_data.database_file) as conn:
+            conn.execute("UPDATE games SET year = 9999 WHERE id = 1")
+        assert data.get_row_by_id("games", 1)["year"] != 9999
+        row = data.add_row("question", {"question_text": "Saved to disk"})
+    finally:
+        data.close()
+    with sqlite3.connect(paralympics_data.database_file) as conn:
+        saved = conn.execute("SELECT question_text FROM question WHERE id = ?", (row["id"],))
+        assert saved.fetchone() == ("Saved to disk",)
+
+
+def test_memory_mode_with_interval_flushes_on_close(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance in memory mode with a long flush interval
+    WHEN a question is added
+    THEN it should be read back at once, but only be in the database file after close
+    """
+    from data.paralympics_data import ParalympicsData
+
+    data = ParalympicsData(paralympics_data.database_file, mode="memory", flush_interval=60)
+    sql = "SELECT COUNT(*) FROM question WHERE question_text = 'Flushed later'"
+    try:
+        row = data.add_row("question", {"question_text": "Flushed later"})
+        assert data.get_row_by_id("question", row["id"]) == row
+        with sqlite3.connect(paralympics_data.database_file) as conn:
+            assert conn.execute(sql).fetchone()[0] == 0
+    finally:
+        data.close()
+    assert data.snapshot.flushes == 1
+    with sqlite3.connect(paralympics_data.database_file) as conn:
+        assert conn.execute(sql).fetchone()[0] == 1
+
+
+def test_memory_mode_write_succeeds_when_flush_fails(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance in memory mode that flushes after every commit
+    WHEN a question is added while another connection holds a write lock on the database file
+    THEN the question should be returned and its table version change, with the flush error kept
+    AND once the lock is released the next write should flush both questions to the file
+    """
+    from data.paralympics_data import ParalympicsData
+
+    data = ParalympicsData(paralympics_data.database_file, mode="memory",
+                           pragmas={"busy_timeout": 100})
+    version = data.versions.version(["question"])
+    locker = sqlite3.connect(paralympics_data.database_file, isolation_level=None)
+    try:
+        locker.execute("BEGIN EXCLUSIVE")
+        first = data.add_row("question", {"question_text": "Written while locked"})
+        assert data.versions.version(["question"]) != version
+        assert isinstance(data.snapshot.last_error, sqlite3.OperationalError)
+        locker.execute("ROLLBACK")
+        second = data.add_row("question", {"question_text": "Written after unlock"})
+        assert data.snapshot.last_error is None
+    finally:
+        locker.close()
+        data.close()
+    with sqlite3.connect(paralympics_data.database_file) as conn:
+        ids = {r[0] for r in conn.execute("SELECT id FROM question")}
+    assert {first["id"], second["id"]} <= ids
+
+
+def test_memory_mode_stream_does_not_block_writes(paralympics_data):
+    """
+    GIVEN a ParalympicsData instance in memory mode with a short busy timeout
+    WHEN a question is added while a stream of the question table is only partly read
+    THEN the question should be added without waiting for the stream
+    """
+    from data.paralympics_data import ParalympicsData
+
+    data = ParalympicsData(paralympics_data.database_file, mode="memory",
+                           pragmas={"busy_timeout": 100})
+    try:
+        stream = data.stream_table("question", batch_size=1)
+        next(stream), next(stream)
+        assert data.add_row("question", {"question_text": "Added mid-stream"})["id"]
+        stream.close()
+    finally:
+        data.close()
@@ -0,0 +1,19 @@
+import pytest
+
+from data.formats import ENCODERS
+
+pa = pytest.importorskip("pyarrow")
+
+
+def test_arrow_column_types_hold_values_from_every_batch():
+    """
+    GIVEN row batches where a column has integers then floats, and another has nulls then text
+    WHEN they are encoded as an Arrow IPC stream
+    THEN the first column should be float64 and the second string, with no value changed
+    """
+    batches = iter([["ratio", "label"], [(1, None), (2, None)], [(1.5, 3), (None, "x")]])
+    table = pa.ipc.open_stream(b"".join(ENCODERS["arrow"](batches))).read_all()
+    assert table.schema.field("ratio").type == pa.float64()
+    assert table.schema.field("label").type == pa.string()
+    assert table.column("ratio").to_pylist() == [1.0, 2.0, 1.5, None]
+    assert table.column("label").to_pylist() == [None, None, "3", "x"]
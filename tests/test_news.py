@@ -0,0 +1,102 @@
+import json
+import time
+
+from paralympics.news import NewsFeed
+
+
+def test_first_stories_are_fetched_and_capped(news_server):
+    """
+    GIVEN a news feed limited to 20 stories
+    WHEN the stories are read for the first time
+    THEN the first 20 stories from the news API should be returned
+    """
+    feed = NewsFeed(news_server.url, max_stories=20)
+    stories = feed.stories()
+    assert len(stories) == 20
+    assert stories[0] == {"title": "Story 0", "url": "https://example.com/0"}
+
+
+def test_stale_stories_are_served_while_refreshing(news_server):
+    """
+    GIVEN a news feed holding stories that are older than its refresh interval
+    WHEN the stories are read while the news API is slow
+    THEN the old stories should be returned at once, and replaced once the refresh has finished
+    """
+    feed = NewsFeed(news_server.url, interval=0)
+    old = feed.stories()
+    news_server.delay = 0.3
+    new_hits = [{"title": "New", "url": "https://example.com/new"}]
+    news_server.body = json.dumps({"hits": new_hits}).encode()
+    start = time.monotonic()
+    assert feed.stories() == old
+    assert time.monotonic() - start < 0.2
+    deadline = time.monotonic() + 5
+    while feed.stories() == old and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert feed.stories()[0]["title"] == "New"
+
+
+def test_failed_refresh_keeps_last_good_stories(news_server):
+    """
+    GIVEN a news feed holding stories
+    WHEN a refresh fails because the news API returns an error
+    THEN the last good stories should still be served and the error recorded
+    """
+    feed = NewsFeed(news_server.url)
+    old = feed.stories()
+    news_server.status = 500
+    assert not feed.refresh()
+    assert feed.last_error is not None
+    assert feed.stories() == old
+
+
+def test_slow_news_api_times_out(news_server):
+    """
+    GIVEN a news API that takes longer to reply than the news feed timeout
+    WHEN the stories are read for the first time
+    THEN an empty list should be returned once the timeout has passed
+    """
+    news_server.delay = 2
+    feed = NewsFeed(news_server.url, timeout=0.2)
+    start = time.monotonic()
+    assert feed.stories() == []
+    assert time.monotonic() - start < 1.5
+
+
+def test_slowly_sent_response_times_out(news_server):
+    """
+    GIVEN a news API that sends its response a few bytes at a time, without pausing for as long as
+    the news feed timeout
+    WHEN the stories are read for the first time
+    THEN an empty list should be returned soon after the timeout, not once the response is complete
+    """
+    news_server.drip = 0.05
+    feed = NewsFeed(news_server.url, timeout=0.5)
+    start = time.monotonic()
+    assert feed.stories() == []
+    assert time.monotonic() - start < 1.5
+    assert "longer than 0.5s" in str(feed.last_error)
+
+
+def test_oversized_response_is_not_read(news_server):
+    """
+    GIVEN a news feed that reads at most 100 bytes
+    WHEN the news API returns a larger response
+    THEN no stories should be returned and the error recorded
+    """
+    feed = NewsFeed(news_server.url, max_bytes=100)
+    assert feed.stories() == []
+    assert "larger than 100 bytes" in str(feed.last_error)
+
+
+def test_news_page_shows_stories_from_feed(app, client, monkeypatch, news_server):
+    """
+    GIVEN a Flask test client whose news feed uses a local news API
+    WHEN the news page is requested twice
+    THEN both pages should list the stories, fetched from the news API once
+    """
+    monkeypatch.setitem(app.extensions, "news_feed", NewsFeed(news_server.url))
+    first = client.get("/news")
+    second = client.get("/news")
+    assert b"Story 0" in first.data and first.data == second.data
+    assert news_server.requests == 1
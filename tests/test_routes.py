@@ -1,3 +1,7 @@
+import pandas as pd
+import pytest
+
+
 def test_print_response_params(client):
     """
     This is just so you can see what type of detail you get in a response object.
@@ -48,3 +52,213 @@ def test_participants_form_post_success(client):
     data = {"paralympics_types": ["winter", "summer"]}
     resp = client.post("/participants", data=data)
     assert resp.status_code == 200
+
+
+def test_quiz_page_reuses_api_connection(app, client):
+    """
+    GIVEN a Flask test client
+    WHEN the quiz page, which makes a REST API request, is requested twice
+    THEN the API requests should share one pooled keep-alive connection
+    """
+    client.get("/")
+    # Without this the second page would be served from the quiz cache with no API request
+    app.extensions["quiz_cache"].invalidate()
+    client.get("/2")
+    adapter = app.extensions["api_client"].session.get_adapter(app.config["API_BASE_URL"])
+    pools = [adapter.poolmanager.pools[key] for key in adapter.poolmanager.pools.keys()]
+    assert len(pools) == 1
+    assert pools[0].num_connections == 1
+    assert pools[0].num_requests >= 2
+
+
+def test_quiz_answer_needs_no_api_request(app, client):
+    """
+    GIVEN a Flask test client that has shown quiz question 1
+    WHEN an answer to the question is posted
+    THEN the answer should be checked with the cached quiz, without a request to the REST API
+    """
+    client.get("/1")
+    quiz = app.extensions["quiz_cache"].get(1)
+    correct = next(r["id"] for r in quiz["responses"] if r["is_correct"])
+    adapter = app.extensions["api_client"].session.get_adapter(app.config["API_BASE_URL"])
+    pools = adapter.poolmanager.pools
+
+    def requests_made():
+        return sum(pools[key].num_requests for key in pools.keys())
+
+    before = requests_made()
+    response = client.post("/1", data={"question": correct})
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith("/2")
+    assert requests_made() == before
+
+
+def test_trends_chart_is_cached(app, client, monkeypatch):
+    """
+    GIVEN a Flask test client with server side chart rendering
+    WHEN the trends page is requested twice
+    THEN the chart should be built once and the second response should use the cached figure
+    """
+    monkeypatch.setitem(app.config, "CHART_RENDERING", "server")
+    figure_cache = app.extensions["figure_cache"]
+    figure_cache.clear()
+    first = client.get("/trends")
+    assert len(figure_cache) == 1
+    second = client.get("/trends")
+    assert len(figure_cache) == 1
+    assert first.data == second.data
+
+
+def test_plotlyjs_served_once_as_static_file(client):
+    """
+    GIVEN a Flask test client with the default static plotly.js mode
+    WHEN the trends page is requested
+    THEN the page should load plotly.js from a script tag rather than inline
+    AND the plotly.js file should be served with a long cache lifetime
+    """
+    from paralympics.charts import plotlyjs_filename
+
+    response = client.get("/trends")
+    src = f"/static/{plotlyjs_filename()}"
+    assert f'src="{src}"'.encode() in response.data
+    assert len(response.data) < 500_000
+    js = client.get(src)
+    assert js.status_code == 200
+    assert "immutable" in js.headers["Cache-Control"]
+    js.close()
+
+
+def test_new_question_saved(client):
+    """
+    GIVEN a Flask test client
+    WHEN a valid new question with 4 options is posted to /question
+    THEN the question should be saved and a success message displayed
+    """
+    data = {"question_text": "Route question", "is_correct_2": "y"}
+    data.update({f"option_text_{i}": f"Option {i}" for i in range(1, 5)})
+    response = client.post("/question", data=data)
+    assert response.status_code == 200
+    assert b"Question saved!" in response.data
+
+
+def test_get_api_data_reads_ndjson_stream(app):
+    """
+    GIVEN the Flask app
+    WHEN the /games data is read as an NDJSON stream in chunks of 10 rows
+    THEN the DataFrame should match the one read from the default columnar response
+    """
+    from paralympics.charts import get_api_data
+
+    with app.app_context():
+        streamed = get_api_data("/games", stream=True, chunk_rows=10)
+        expected = get_api_data("/games")
+    assert streamed.equals(expected)
+
+
+def test_get_api_data_reads_compact_json(app):
+    """
+    GIVEN the Flask app
+    WHEN the /games data is read in the compact JSON shape
+    THEN the DataFrame should match the one read from the default columnar response
+    """
+    from paralympics.charts import get_api_data
+
+    with app.app_context():
+        compact = get_api_data("/games", compact=True)
+        expected = get_api_data("/games")
+    pd.testing.assert_frame_equal(compact, expected, check_dtype=False)
+
+
+def test_trends_page_has_chart_placeholder(app, client):
+    """
+    GIVEN a Flask test client with the default client side chart rendering
+    WHEN the trends page is requested
+    THEN the page should contain a placeholder with the figure URL instead of the chart
+    AND no figure should have been built
+    """
+    figure_cache = app.extensions["figure_cache"]
+    figure_cache.clear()
+    response = client.get("/trends")
+    assert b'data-figure-url="/charts/line/countries.json"' in response.data
+    assert len(figure_cache) == 0
+
+
+def test_chart_figure_json_is_cached_and_revalidated(app, client):
+    """
+    GIVEN a Flask test client
+    WHEN the figure JSON for the sports line chart is requested twice, the second time with its ETag
+    THEN the figure should be built once and the second response should be 304 Not Modified
+    """
+    figure_cache = app.extensions["figure_cache"]
+    figure_cache.clear()
+    first = client.get("/charts/line/sports.json")
+    assert first.status_code == 200
+    figure = first.get_json()
+    assert figure["data"] and "layout" in figure
+    second = client.get("/charts/line/sports.json", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+    assert len(figure_cache) == 1
+
+
+@pytest.mark.parametrize("url", ["/charts/pie.json", "/charts/line/nope.json",
+                                 "/charts/map/extra.json", "/charts/bar.json"])
+def test_unknown_chart_figure_is_not_found(client, url):
+    """
+    GIVEN a Flask test client
+    WHEN figure JSON is requested for an unknown chart or with invalid parameters
+    THEN the response should be 404 Not Found
+    """
+    assert client.get(url).status_code == 404
+
+
+def test_chart_figure_build_error_is_not_a_not_found(app, client, monkeypatch):
+    """
+    GIVEN a Flask test client where building the line chart fails with a KeyError
+    WHEN the figure JSON of a valid line chart is requested
+    THEN the error should be raised rather than turned into 404 Not Found
+    """
+    from paralympics import charts
+
+    def broken_chart(feature):
+        raise KeyError("missing column")
+
+    monkeypatch.setitem(charts.CHARTS, "line", broken_chart)
+    app.extensions["figure_cache"].clear()
+    with pytest.raises(KeyError):
+        client.get("/charts/line/sports.json")
+
+
+def test_chart_warmup_fills_figure_cache_and_reports_ready():
+    """
+    GIVEN an app created with chart warm-up enabled
+    WHEN the warm-up has finished
+    THEN every chart variant should be in the figure cache and /ready should return 200
+    """
+    from paralympics import create_app
+    from paralympics.charts import CHART_VARIANTS
+    from paralympics.config import TestingConfig
+
+    class WarmupConfig(TestingConfig):
+        CHART_WARMUP = True
+        CHART_WARMUP_INTERVAL = 0.2
+
+    app = create_app(WarmupConfig)
+    warmer = app.extensions["chart_warmer"]
+    try:
+        assert warmer.ready.wait(timeout=30)
+        assert len(app.extensions["figure_cache"]) == len(CHART_VARIANTS)
+        assert app.test_client().get("/ready").status_code == 200
+    finally:
+        warmer.stop()
+
+
+def test_ready_is_unavailable_until_warm(app, client, monkeypatch):
+    """
+    GIVEN an app whose chart warm-up has not finished
+    WHEN /ready is requested
+    THEN the response should be 503 Service Unavailable
+    """
+    from paralympics.warmup import ChartWarmer
+
+    monkeypatch.setitem(app.extensions, "chart_warmer", ChartWarmer(app))
+    assert client.get("/ready").status_code == 503